@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+from metrics_helper import BROWSER_ACQUIRE_SECONDS, BROWSERS_RUNNING, CONTEXTS_ACTIVE
+
+logger = logging.getLogger(__name__)
+
+# Lightweight Chromium profile for RPA: no GPU, extensions or background
+# services, and a tiny disk cache since every context starts fresh anyway
+LAUNCH_ARGS = [
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-component-extensions-with-background-pages",
+    "--disable-background-networking",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-translate",
+    "--disable-dev-shm-usage",
+    "--mute-audio",
+    "--no-first-run",
+    "--disk-cache-size=1048576",
+    "--media-cache-size=1048576",
+]
+
+# Resource types the CLIK forms and the PDF download never need
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+# Third-party analytics and trackers
+BLOCKED_URL_PATTERNS = [
+    r"google-analytics\.com",
+    r"googletagmanager\.com",
+    r"doubleclick\.net",
+    r"facebook\.(net|com)/tr",
+    r"hotjar\.com",
+    r"clarity\.ms",
+]
+
+
+class ResourcePolicy:
+    """
+    Request-interception policy for RPA contexts. Blocks heavy resource types
+    and analytics URLs; anything matching `allow_patterns` always goes through.
+    """
+
+    def __init__(self, blocked_types=None, blocked_patterns=None, allow_patterns=None):
+        self.blocked_types = set(BLOCKED_RESOURCE_TYPES if blocked_types is None else blocked_types)
+        self.blocked = [re.compile(p) for p in (BLOCKED_URL_PATTERNS if blocked_patterns is None else blocked_patterns)]
+        self.allowed = [re.compile(p) for p in (allow_patterns or [])]
+
+    def should_block(self, url: str, resource_type: str) -> bool:
+        if any(p.search(url) for p in self.allowed):
+            return False
+        return resource_type in self.blocked_types or any(p.search(url) for p in self.blocked)
+
+    async def _handle(self, route):
+        request = route.request
+        if self.should_block(request.url, request.resource_type):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def apply(self, context):
+        await context.route("**/*", self._handle)
+
+
+class _BrowserSlot:
+    """One pooled Chromium process and how many contexts it has served."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.browser = None
+        self.uses = 0
+        self.crashed = False
+
+
+class BrowserPool:
+    """
+    Process-wide pool of long-lived Chromium browsers.
+    Each acquire hands out a fresh, isolated BrowserContext on a pooled browser.
+    Browsers are relaunched after `max_uses` contexts or when they crash.
+    """
+
+    def __init__(self, size: int = 2, max_uses: int = 50, headless: bool = True,
+                 resource_policy: ResourcePolicy = None, name: str = "default"):
+        self.name = name
+        self.size = size
+        self.max_uses = max_uses
+        self.headless = headless
+        self.resource_policy = resource_policy
+        self._playwright = None
+        self._slots = []
+        self._idle = None
+        self._started = False
+        self._start_lock = asyncio.Lock()
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    def has_idle(self) -> bool:
+        """True when a context can be handed out without waiting."""
+        return self._started and not self._idle.empty()
+
+    async def start(self):
+        async with self._start_lock:
+            if self._started:
+                return
+            self._playwright = await async_playwright().start()
+            self._idle = asyncio.Queue()
+            self._slots = [_BrowserSlot(i) for i in range(self.size)]
+            try:
+                for slot in self._slots:
+                    await self._launch(slot)
+                    self._idle.put_nowait(slot)
+            except Exception:
+                # e.g. a headed pool on a host without a display
+                for slot in self._slots:
+                    await self._close(slot)
+                await self._playwright.stop()
+                self._playwright = None
+                raise
+            self._started = True
+            logger.info(f"Browser pool started with {self.size} browser(s), headless={self.headless}")
+
+    async def stop(self):
+        if not self._started:
+            return
+        self._started = False
+        for slot in self._slots:
+            await self._close(slot)
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+        logger.info("Browser pool stopped")
+
+    async def _launch(self, slot: _BrowserSlot):
+        slot.browser = await self._playwright.chromium.launch(headless=self.headless, args=LAUNCH_ARGS)
+        BROWSERS_RUNNING.labels(self.name).inc()
+        slot.uses = 0
+        slot.crashed = False
+
+        def _on_disconnected(_browser, slot=slot):
+            slot.crashed = True
+
+        slot.browser.on("disconnected", _on_disconnected)
+
+    async def _close(self, slot: _BrowserSlot):
+        if slot.browser is None:
+            return
+        try:
+            await slot.browser.close()
+        except Exception as e:
+            logger.warning(f"Browser #{slot.index} did not close cleanly: {str(e)}")
+        slot.browser = None
+        BROWSERS_RUNNING.labels(self.name).dec()
+
+    async def _recycle_if_needed(self, slot: _BrowserSlot):
+        if slot.browser is None or slot.crashed or not slot.browser.is_connected():
+            logger.warning(f"Browser #{slot.index} is gone, relaunching")
+            await self._close(slot)
+            await self._launch(slot)
+        elif slot.uses >= self.max_uses:
+            logger.info(f"Browser #{slot.index} served {slot.uses} contexts, recycling")
+            await self._close(slot)
+            await self._launch(slot)
+
+    @asynccontextmanager
+    async def context(self, block_resources: bool = True, **context_options):
+        """
+        Yields a fresh BrowserContext; it is closed and the browser returned on exit.
+        Pass block_resources=False to load every resource, e.g. while debugging a flow.
+        """
+        if not self._started:
+            raise RuntimeError("Browser pool is not started")
+
+        started = time.monotonic()
+        slot = await self._idle.get()
+        context = None
+        try:
+            await self._recycle_if_needed(slot)
+            slot.uses += 1
+            context = await slot.browser.new_context(**context_options)
+            if block_resources and self.resource_policy is not None:
+                await self.resource_policy.apply(context)
+            BROWSER_ACQUIRE_SECONDS.labels(self.name).observe(time.monotonic() - started)
+            CONTEXTS_ACTIVE.labels(self.name).inc()
+            try:
+                yield context
+            finally:
+                CONTEXTS_ACTIVE.labels(self.name).dec()
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.warning(f"Context on browser #{slot.index} did not close cleanly: {str(e)}")
+            self._idle.put_nowait(slot)
@@ -1,94 +1,248 @@
 import os
-from dotenv import load_dotenv
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from types import MappingProxyType
+from dotenv import load_dotenv, dotenv_values
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialised within this process
+    fcntl = None
+
 # 1. Auto-load variables from .env
+# (once, at import, so env-configurable constants such as BROWSER_POOL_SIZE
+# can live in config.py; later changes are only seen through ConfigService)
 ENV_PATH = Path(__file__).parent / "config.py"
 load_dotenv(dotenv_path=ENV_PATH, override=True)
 
+LOCK_PATH = ENV_PATH.with_name(ENV_PATH.name + ".lock")
+# Bumped by every update_env write; doubles as the ETag of PUT /config
+VERSION_KEY = "CONFIG_VERSION"
+# KEY=value lines, keeping everything around the value (spacing, inline comment)
+_ASSIGNMENT = re.compile(
+    r"""^(?P<prefix>\s*(?:export\s+)?(?P<key>[A-Za-z_][A-Za-z0-9_]*)\s*=\s*)"""
+    r"""(?P<value>"(?:[^"\\]|\\.)*"|'[^']*'|[^\s#]*)(?P<rest>.*)$"""
+)
+_write_lock = threading.Lock()
+
+
+def _unquote(raw: str) -> str:
+    # Strip quotes if present (just in case they were added manually or by error)
+    if len(raw) >= 2 and raw[0] == raw[-1] and raw[0] in ("'", '"'):
+        return raw[1:-1]
+    return raw
+
+
+# Environment profiles: the unsuffixed keys are UAT, any other profile
+# reads the same keys with a _<PROFILE> suffix (LOGIN_URL_PROD, ...)
+BASE_PROFILE = "UAT"
+PROFILE_KEYS = ("LOGIN_URL", "USERNAME", "PASSWORD", "BASE_URL")
+
+
+@dataclass(frozen=True)
+class Profile:
+    """CLIK credentials of one environment profile."""
+    name: str
+    LOGIN_URL: str
+    USERNAME: str
+    PASSWORD: str
+    BASE_URL: str
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.LOGIN_URL and self.USERNAME and self.PASSWORD and self.BASE_URL)
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Immutable snapshot of config.py. `values` holds every key in the file."""
+    LOGIN_URL: str
+    USERNAME: str
+    PASSWORD: str
+    BASE_URL: str
+    HEADLESS: bool
+    version: int
+    values: MappingProxyType
+
+    def as_dict(self) -> dict:
+        return {
+            "LOGIN_URL": self.LOGIN_URL,
+            "USERNAME":  self.USERNAME,
+            "PASSWORD":  self.PASSWORD,
+            "BASE_URL":  self.BASE_URL,
+            "HEADLESS":  self.HEADLESS
+        }
+
+    def profile(self, name: str) -> Profile:
+        name = name.upper()
+        if name == BASE_PROFILE:
+            return Profile(name, self.LOGIN_URL, self.USERNAME, self.PASSWORD, self.BASE_URL)
+        return Profile(name, *(_unquote(self.values.get(f"{key}_{name}", "")) for key in PROFILE_KEYS))
+
+
+def parse_settings(path: Path) -> Settings:
+    values = {k: v for k, v in dotenv_values(path).items() if v is not None}
+
+    def get(key: str, default: str = "") -> str:
+        # Keys missing from the file fall back to the process environment
+        return _unquote(values.get(key, os.getenv(key, default)))
+
+    return Settings(
+        LOGIN_URL=get("LOGIN_URL"),
+        USERNAME=get("USERNAME"),
+        PASSWORD=get("PASSWORD"),
+        BASE_URL=get("BASE_URL"),
+        HEADLESS=get("HEADLESS", "False").lower() in ("1", "true", "yes"),
+        version=int(values.get(VERSION_KEY) or 0),
+        values=MappingProxyType(values)
+    )
+
+
+class ConfigService:
+    """
+    Holds the current Settings snapshot of config.py.
+    The file is parsed only when its mtime, inode or size changes (or on
+    reload()), and the new snapshot replaces the old one in a single
+    assignment, so readers always see one complete version. It never
+    touches os.environ.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._snapshot = None
+
+    def _stat(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def reload(self) -> Settings:
+        with self._lock:
+            signature = self._stat()
+            self._snapshot = parse_settings(self.path)
+            self._signature = signature
+            return self._snapshot
+
+    def snapshot(self) -> Settings:
+        """Current settings; re-parses config.py only if it changed on disk."""
+        snapshot = self._snapshot
+        try:
+            changed = self._stat() != self._signature
+        except OSError:
+            changed = snapshot is None
+        if changed or snapshot is None:
+            snapshot = self.reload()
+        return snapshot
+
+
+config_service = ConfigService(ENV_PATH)
+
+
 def load_settings() -> dict:
     """
     Returns a dict of current settings,
     converting HEADLESS into a boolean.
     """
-    # Ensure we have the latest values from the file
-    load_dotenv(dotenv_path=ENV_PATH, override=True)
-    
-    # Get the raw value from environment (without quotes)
-    headless_raw = os.getenv("HEADLESS", "False")
-    
-    # Strip quotes if present (just in case they were added manually or by error)
-    if headless_raw.startswith('"') and headless_raw.endswith('"'):
-        headless_raw = headless_raw[1:-1]
-    elif headless_raw.startswith("'") and headless_raw.endswith("'"):
-        headless_raw = headless_raw[1:-1]
-    
-    return {
-        "LOGIN_URL":  os.getenv("LOGIN_URL", ""),
-        "USERNAME":   os.getenv("USERNAME", ""),
-        "PASSWORD":   os.getenv("PASSWORD", ""),
-        "BASE_URL":   os.getenv("BASE_URL", ""),
-        "HEADLESS":   headless_raw.lower() in ("1", "true", "yes")
-    }
-
-def update_env(updates: dict):
+    return config_service.snapshot().as_dict()
+
+
+class ConfigConflict(Exception):
+    """config.py is no longer at the version the caller expected."""
+
+    def __init__(self, expected: int, current: int):
+        super().__init__(f"Config is at version {current}, not {expected}")
+        self.expected = expected
+        self.current = current
+
+
+@contextmanager
+def _locked():
+    """Serialises writers within this process and, via flock, across processes."""
+    with _write_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(LOCK_PATH, "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _format_value(key: str, value) -> str:
+    if key == "HEADLESS":
+        # Boolean literal in python: True or False, unquoted
+        if isinstance(value, bool):
+            return "True" if value else "False"
+        return "True" if str(value).lower() == "true" else "False"
+    # All other known keys are strings and must be quoted
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'"{escaped}"'
+
+
+def _write_atomic(path: Path, text: str):
+    """Writes to a temp file in the same directory, fsyncs it and renames it over `path`."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # Persist the rename itself
+        dir_fd = os.open(path.parent, os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def update_env(updates: dict, expected_version: int = None) -> Settings:
     """
-    Overwrites values in the config.py file.
-    Ensures strings are quoted and booleans (HEADLESS) are unquoted.
-    PRESERVES existing values that are not in the updates dict.
+    Updates values in the config.py file and returns the new snapshot.
+    Edits are line-wise: comments, ordering and untouched keys (e.g. the
+    *_PROD ones) keep their formatting; new keys are appended.
+    Strings are quoted and booleans (HEADLESS) are unquoted.
+    Every write bumps CONFIG_VERSION; pass `expected_version` for a
+    compare-and-swap update that raises ConfigConflict if someone else
+    wrote first. The file is replaced atomically, so readers never see a
+    half-written credential.
     """
-    # 1. Read existing configuration to preserve comments and layout if possible,
-    # or at least preserve values not being updated.
-    # However, for simplicity and robustness against the fragile parsing, 
-    # we will read the current ENV vars as the source of truth for partial updates (if needed),
-    # but the requirement implies we might want to just re-write the specific keys.
-    
-    # Because the file is a python file, we construct the content carefully.
-    # We will read the file line by line to build a map of existing keys to preserve their order/existence if we wanted to be fancy,
-    # but the original implementation just overwrote 'data' dict from the file.
-    # Let's stick to the previous logic but improve writing.
-    
-    # Read existing lines to capture keys that might be there but not in 'updates' (though we likely update all relevant ones)
-    current_lines = ENV_PATH.read_text().splitlines()
-    data = {}
-    
-    for line in current_lines:
-        line = line.strip()
-        if line and not line.startswith("#") and "=" in line:
-            key, val = line.split("=", 1)
-            key = key.strip()
-            val = val.strip()
-            # Store raw value for now
-            data[key] = val
-
-    # 2. Apply updates
-    for k, v in updates.items():
-        if k == "HEADLESS":
-            # Boolean/String logic for HEADLESS
-            # We want it to be True or False (boolean literal in python)
-            if isinstance(v, bool):
-                val_str = "True" if v else "False"
-            else:
-                # If it comes as string "True"/"False"
-                val_str = "True" if str(v).lower() == "true" else "False"
-            data[k] = val_str
-        else:
-            # All other known keys are strings and must be quoted
-            # We assume 'v' is the raw string value (e.g. user input)
-            # escape double quotes if necessary? simplistic approach for now:
-            # The previous code didn't escape, so we'll just wrap in double quotes.
-            # Avoid double quoting if already quoted (though updates usually come raw)
-            
-            # The input 'v' from the API is likely raw string.
-            val_str = f'"{v}"'
-            data[k] = val_str
-
-    # 3. Write back
-    # We write completely new content to ensure clean formatting
-    output_lines = []
-    for key, val in data.items():
-        output_lines.append(f"{key}={val}")
-        
-    with open(ENV_PATH, "w", encoding="utf-8") as f:
-        f.write("\n".join(output_lines))
-        f.write("\n") # trailing newline
\ No newline at end of file
+    with _locked():
+        lines = ENV_PATH.read_text(encoding="utf-8").splitlines() if ENV_PATH.exists() else []
+        current = parse_settings(ENV_PATH).version if lines else 0
+        if expected_version is not None and expected_version != current:
+            raise ConfigConflict(expected_version, current)
+
+        pending = {k: _format_value(k, v) for k, v in updates.items() if k != VERSION_KEY}
+        pending[VERSION_KEY] = str(current + 1)
+
+        output_lines = []
+        for line in lines:
+            match = _ASSIGNMENT.match(line)
+            if match and match.group("key") in pending:
+                value = pending.pop(match.group("key"))
+                line = f"{match.group('prefix')}{value}{match.group('rest')}"
+            output_lines.append(line)
+        for key, value in pending.items():
+            output_lines.append(f"{key}={value}")
+
+        _write_atomic(ENV_PATH, "\n".join(output_lines) + "\n")
+        return config_service.reload()
@@ -0,0 +1,154 @@
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Append new steps; never edit one that has shipped.
+MIGRATIONS = [
+    # 1: message-id store
+    [
+        """CREATE TABLE IF NOT EXISTS id_mappings (
+               submission_id TEXT PRIMARY KEY,
+               message_id TEXT NOT NULL,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )""",
+        """CREATE TABLE IF NOT EXISTS counter_state (
+               id INTEGER PRIMARY KEY,
+               last_val INTEGER NOT NULL
+           )""",
+        "INSERT OR IGNORE INTO counter_state (id, last_val) VALUES (1, 0)",
+    ],
+    # 2: asynchronous report jobs
+    [
+        """CREATE TABLE IF NOT EXISTS rpa_jobs (
+               job_id TEXT PRIMARY KEY,
+               job_type TEXT NOT NULL,
+               status TEXT NOT NULL,
+               payload TEXT NOT NULL,
+               webhook_url TEXT,
+               result TEXT,
+               error TEXT,
+               queue_wait_seconds REAL,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               started_at TIMESTAMP,
+               finished_at TIMESTAMP
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_rpa_jobs_status ON rpa_jobs (status, created_at)",
+    ],
+    # 3: idempotent report results
+    [
+        """CREATE TABLE IF NOT EXISTS report_results (
+               message_id TEXT PRIMARY KEY,
+               report_type TEXT NOT NULL,
+               payload_hash TEXT NOT NULL,
+               status TEXT NOT NULL,
+               result TEXT,
+               error TEXT,
+               updated_at TIMESTAMP NOT NULL
+           )""",
+    ],
+    # 4: per-(type_code, year, month) message-id sequences, seeded with the
+    # highest counter already used for each suffix in id_mappings
+    [
+        """CREATE TABLE IF NOT EXISTS id_sequences (
+               type_code TEXT NOT NULL,
+               year INTEGER NOT NULL,
+               month INTEGER NOT NULL,
+               last_val INTEGER NOT NULL,
+               PRIMARY KEY (type_code, year, month)
+           )""",
+        """INSERT OR IGNORE INTO id_sequences (type_code, year, month, last_val)
+           SELECT substr(message_id, 6, length(message_id) - 11),
+                  CAST(substr(message_id, -4) AS INTEGER),
+                  CAST(substr(message_id, -6, 2) AS INTEGER),
+                  MAX(CAST(substr(message_id, 1, 5) AS INTEGER))
+           FROM id_mappings
+           WHERE length(message_id) > 11
+           GROUP BY 1, 2, 3""",
+        # Not UNIQUE: ids minted before the monthly reset may already repeat
+        "CREATE INDEX IF NOT EXISTS idx_id_mappings_message_id ON id_mappings (message_id)",
+    ],
+    # 5: keyset pagination of id_mappings, newest first
+    [
+        "CREATE INDEX IF NOT EXISTS idx_id_mappings_created ON id_mappings (created_at, submission_id)",
+    ],
+]
+
+
+class Database:
+    """
+    Managed SQLite access for the app.
+    Each thread keeps one long-lived connection (FastAPI runs sync endpoints
+    on a thread pool), so compiled statements stay in the connection's
+    statement cache. The file runs in WAL mode so readers never block the
+    writer, with synchronous=NORMAL and a busy timeout instead of
+    "database is locked" errors.
+    """
+
+    def __init__(self, path: str, synchronous: str = "NORMAL", busy_timeout_ms: int = 5000):
+        self.path = path
+        self.synchronous = synchronous
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        # isolation_level=None: we issue BEGIN/COMMIT ourselves via transaction()
+        conn = sqlite3.connect(self.path, isolation_level=None, cached_statements=256,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Returns this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate: bool = False):
+        """
+        Runs the block in one transaction on this thread's connection.
+        immediate=True takes the write lock up front (BEGIN IMMEDIATE), for
+        read-then-write sequences that must not interleave with another writer.
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def migrate(self):
+        """Brings the schema up to date; run once at startup."""
+        with self.transaction(immediate=True) as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+                for sql in statements:
+                    conn.execute(sql)
+                conn.execute(f"PRAGMA user_version={number}")
+                logger.info(f"Database {self.path} migrated to schema version {number}")
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections = []
+        self._local = threading.local()
@@ -0,0 +1,215 @@
+import os
+import random
+import time
+import mimetypes
+import shutil
+import tempfile
+import threading
+import logging
+from datetime import datetime, timedelta
+
+import httplib2
+import google_auth_httplib2
+from google.auth.transport.requests import Request as GoogleRequest
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
+
+from metrics_helper import UPLOAD_SECONDS, UPLOAD_BYTES, UPLOAD_RETRIES, failure_class
+from opentelemetry import trace
+from tracing_helper import tracer
+
+logger = logging.getLogger(__name__)
+
+# --- GOOGLE DRIVE CONFIGURATION ---
+SHARED_DRIVE_FOLDER_ID = '1qIApzUHagAmouW0Q2p4R9R9Vwyhs8nxq'
+SCOPES = ['https://www.googleapis.com/auth/drive']
+CREDENTIALS_FILE = 'credentials.json'
+TOKEN_FILE = 'token.json'
+
+# Resumable upload chunk size (must be a multiple of 256 KB)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Captured artifacts larger than this spill from memory to a temp file
+SPOOL_MAX_BYTES = int(os.getenv("UPLOAD_SPOOL_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# Upload-level retry budget, independent of the browser retry loop
+UPLOAD_MAX_RETRIES = int(os.getenv("UPLOAD_MAX_RETRIES", "5"))
+UPLOAD_RETRY_BASE_DELAY = float(os.getenv("UPLOAD_RETRY_BASE_DELAY", "1"))
+UPLOAD_RETRY_MAX_DELAY = 30
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Refresh the access token this long before it actually expires
+REFRESH_MARGIN = timedelta(minutes=5)
+
+
+class DriveClient:
+    """
+    Process-wide Google Drive client.
+    Credentials are read from disk once and kept in memory; the token is
+    refreshed under a lock only when it is close to expiry. The discovery
+    document is parsed once, and each worker thread gets its own authorized
+    Http object because httplib2 is not thread-safe.
+    """
+
+    def __init__(self):
+        self._creds = None
+        self._service = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _authenticate(self):
+        """Handles the OAuth 2.0 authentication flow."""
+        creds = None
+        if os.path.exists(TOKEN_FILE):
+            creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+
+        if not creds or not creds.valid:
+            if creds and creds.refresh_token:
+                creds.refresh(GoogleRequest())
+            else:
+                print("Launching browser for initial authentication. Please sign in...")
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    CREDENTIALS_FILE, SCOPES)
+                creds = flow.run_local_server(port=0)
+            self._save(creds)
+        return creds
+
+    def _save(self, creds):
+        with open(TOKEN_FILE, 'w') as token:
+            token.write(creds.to_json())
+        logger.info(f"Drive token saved to {TOKEN_FILE}")
+
+    def _needs_refresh(self) -> bool:
+        creds = self._creds
+        if creds.expiry is None:
+            return not creds.valid
+        # google-auth keeps expiry as a naive UTC datetime
+        return creds.expiry - REFRESH_MARGIN <= datetime.utcnow()
+
+    def credentials(self):
+        """Returns in-memory credentials, loading or refreshing them only when needed."""
+        if self._creds is not None and not self._needs_refresh():
+            return self._creds
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._creds is None:
+                self._creds = self._authenticate()
+            elif self._needs_refresh():
+                logger.info("Drive access token near expiry, refreshing")
+                self._creds.refresh(GoogleRequest())
+                self._save(self._creds)
+            return self._creds
+
+    def service(self):
+        """Returns the shared Drive v3 service, built once from the discovery document."""
+        if self._service is None:
+            # Outside the lock: credentials() takes it too, and it is not reentrant
+            creds = self.credentials()
+            with self._lock:
+                if self._service is None:
+                    self._service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        return self._service
+
+    def http(self):
+        """Returns this thread's authorized Http object."""
+        creds = self.credentials()
+        http = getattr(self._local, "http", None)
+        if http is None or http.credentials is not creds:
+            http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http())
+            self._local.http = http
+        return http
+
+    def upload_stream(self, fh, file_name: str, mimetype: str = None):
+        """
+        Streams `fh` to the shared folder as a resumable, chunked upload,
+        makes it link-readable and returns (id, webViewLink).
+        The MIME type is detected from `file_name` unless given.
+        """
+        started = time.monotonic()
+        file_type = os.path.splitext(file_name)[1].lstrip('.').lower() or 'unknown'
+        with tracer.start_as_current_span("drive.upload", attributes={"drive.file_name": file_name}) as span:
+            try:
+                file, size = self._upload(fh, file_name, mimetype)
+            except Exception:
+                UPLOAD_SECONDS.labels(file_type, "failed").observe(time.monotonic() - started)
+                raise
+            UPLOAD_SECONDS.labels(file_type, "succeeded").observe(time.monotonic() - started)
+            UPLOAD_BYTES.labels(file_type).inc(size)
+            span.set_attribute("drive.bytes", size)
+            span.set_attribute("drive.file_id", file['id'])
+        return file['id'], file['webViewLink']
+
+    def _upload(self, fh, file_name: str, mimetype: str = None):
+        """Returns the created file's metadata and the number of bytes sent."""
+        service = self.service()
+        file_metadata = {
+            'name': file_name,
+            'parents': [SHARED_DRIVE_FOLDER_ID]
+        }
+        media = MediaIoBaseUpload(fh, mimetype=mimetype or guess_mimetype(file_name),
+                                  chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+        request = service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields='id, webViewLink',
+            supportsAllDrives=True
+        )
+        file = None
+        failures = 0
+        while file is None:
+            try:
+                # After a failed chunk the client asks Drive for the last
+                # acknowledged byte and resumes from there
+                _, file = request.next_chunk(http=self.http())
+            except Exception as e:
+                failures = self._backoff(e, failures, file_name)
+
+        failures = 0
+        while True:
+            try:
+                service.permissions().create(
+                    fileId=file['id'],
+                    body={'type': 'anyone', 'role': 'reader'},
+                    supportsAllDrives=True
+                ).execute(http=self.http())
+                break
+            except Exception as e:
+                failures = self._backoff(e, failures, file_name)
+        return file, media.size()
+
+    def _backoff(self, error: Exception, failures: int, file_name: str) -> int:
+        """Sleeps with full jitter before the next try, or re-raises when the error is final."""
+        if not is_retryable(error) or failures >= UPLOAD_MAX_RETRIES:
+            raise error
+        UPLOAD_RETRIES.labels(failure_class(error)).inc()
+        delay = random.uniform(0, min(UPLOAD_RETRY_MAX_DELAY, UPLOAD_RETRY_BASE_DELAY * (2 ** failures)))
+        trace.get_current_span().add_event("retry", {"attempt": failures + 1, "error": str(error), "delay": delay})
+        logger.warning(f"Drive upload of {file_name} failed ({str(error)}), retry {failures+1} in {delay:.1f}s")
+        time.sleep(delay)
+        return failures + 1
+
+
+def guess_mimetype(file_name: str) -> str:
+    mimetype, _ = mimetypes.guess_type(file_name)
+    return mimetype or 'application/octet-stream'
+
+
+def is_retryable(error: Exception) -> bool:
+    """Transient Drive/network failures are retried; anything else is final."""
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUS
+    return isinstance(error, (httplib2.HttpLib2Error, ConnectionError, TimeoutError))
+
+
+def spool_file(path: str):
+    """
+    Copies `path` into a SpooledTemporaryFile that stays in memory up to
+    SPOOL_MAX_BYTES and only then spills to disk. The caller closes it.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    with open(path, 'rb') as src:
+        shutil.copyfileobj(src, spool)
+    spool.seek(0)
+    return spool
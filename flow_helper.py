@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+from metrics_helper import STEP_SECONDS, STEP_FAILURES, failure_class
+from tracing_helper import tracer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Step:
+    """
+    One named, checkpointed stage of an RPA run.
+    `restart_from` names the earlier step to resume from when this one fails,
+    for steps whose progress lives only in page state (e.g. a half-filled form).
+    `timeout` is the step's budget in ms for each Playwright wait and action.
+    """
+    name: str
+    run: Callable[["ReportRun"], Awaitable[None]]
+    max_attempts: int = 3
+    base_delay: float = 2
+    needs_page: bool = True
+    restart_from: Optional[str] = None
+    timeout: int = 30000
+
+
+class StepFailed(Exception):
+    def __init__(self, step: str, error: Exception):
+        super().__init__(f"Step '{step}' failed: {str(error)}")
+        self.step = step
+        self.error = error
+
+
+class ReportRun:
+    """
+    State of one report run: completed steps (checkpoints), captured artifacts
+    and the browser page currently in use.
+    `open_context(run)` returns an async context manager yielding a BrowserContext;
+    `resume_page` is awaited on every fresh page so post-submit steps can
+    navigate back to the report result instead of submitting again.
+    `options` carries per-run switches (e.g. debug) for those callbacks.
+    """
+
+    def __init__(self, kind: str, req, open_context, resume_page, options: dict = None):
+        self.kind = kind
+        self.req = req
+        self.options = options or {}
+        self.completed = []
+        self.artifacts = {}
+        self.submitted = False
+        self.result_url = None
+        self.failures = 0
+        self.timings = {}
+        self.page = None
+        self._open_context = open_context
+        self._resume_page = resume_page
+        self._stack = None
+
+    async def ensure_page(self):
+        if self.page is not None and not self.page.is_closed():
+            return self.page
+        await self.release_page()
+        with tracer.start_as_current_span("rpa.open_page", attributes={"rpa.resume": bool(self.result_url)}):
+            self._stack = AsyncExitStack()
+            context = await self._stack.enter_async_context(self._open_context(self))
+            self.page = await context.new_page()
+            await self._resume_page(self)
+        return self.page
+
+    async def release_page(self):
+        """Closes the current page's context and hands the browser back to the pool."""
+        self.page = None
+        if self._stack is not None:
+            stack, self._stack = self._stack, None
+            await stack.aclose()
+
+    async def close(self):
+        await self.release_page()
+        for artifact in self.artifacts.values():
+            if hasattr(artifact, "close"):
+                artifact.close()
+
+
+async def execute(run: ReportRun, steps: list):
+    """
+    Runs `steps` in order, skipping those already checkpointed in `run`.
+    A failed step is retried under its own policy. Steps never restart
+    before a submission that already went out, so a report is never
+    submitted (and billed) twice.
+    """
+    names = [step.name for step in steps]
+    attempts = {name: 0 for name in names}
+    index = 0
+    try:
+        while index < len(steps):
+            step = steps[index]
+            if step.name in run.completed:
+                index += 1
+                continue
+            started = time.monotonic()
+            try:
+                with tracer.start_as_current_span(f"rpa.step {step.name}", attributes={
+                    "rpa.kind": run.kind,
+                    "rpa.step": step.name,
+                    "rpa.attempt": attempts[step.name] + 1,
+                    "rpa.message_id": getattr(run.req, "message_id", None) or "",
+                }):
+                    if step.needs_page:
+                        page = await run.ensure_page()
+                        page.set_default_timeout(step.timeout)
+                    else:
+                        await run.release_page()
+                    await step.run(run)
+                run.completed.append(step.name)
+                run.timings[step.name] = round(time.monotonic() - started, 3)
+                STEP_SECONDS.labels(run.kind, step.name, "succeeded").observe(time.monotonic() - started)
+                index += 1
+            except Exception as e:
+                attempts[step.name] += 1
+                STEP_SECONDS.labels(run.kind, step.name, "failed").observe(time.monotonic() - started)
+                STEP_FAILURES.labels(run.kind, step.name, failure_class(e)).inc()
+                logger.error(f"{run.kind} step '{step.name}' attempt {attempts[step.name]} failed: {str(e)}")
+                if run.page is not None:
+                    try:
+                        await run.page.screenshot(path=f"ss-{run.kind}-error-{step.name}-attempt{attempts[step.name]}.png")
+                    except Exception:
+                        pass
+                # Page state after a failure is unknown; the next attempt starts on a fresh page
+                await run.release_page()
+
+                if attempts[step.name] >= step.max_attempts:
+                    raise StepFailed(step.name, e)
+                if step.restart_from:
+                    if run.submitted:
+                        # Going back before the submission would send a second inquiry
+                        raise StepFailed(step.name, e)
+                    index = names.index(step.restart_from)
+                    if step.restart_from in run.completed:
+                        del run.completed[run.completed.index(step.restart_from):]
+
+                run.failures += 1
+                delay = step.base_delay * (2 ** (attempts[step.name] - 1))
+                logger.info(f"Retrying {run.kind} step '{names[index]}' in {delay} seconds...")
+                await asyncio.sleep(delay)
+    finally:
+        await run.release_page()
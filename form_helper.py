@@ -0,0 +1,203 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional
+from tracing_helper import tracer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Field:
+    """
+    One declarative form action.
+    The element is found by `css`, by ARIA `role` + `name`, or by visible `text`.
+    The value comes from the request attribute `source` or the fixed `value`.
+    Batchable fields are set together in one page.evaluate round trip; only
+    mark a field batchable when it is located by `css`, already present when
+    the form loads and independent of the other fields.
+    """
+    action: str
+    css: Optional[str] = None
+    role: Optional[str] = None
+    name: Optional[str] = None
+    text: Optional[str] = None
+    nth: Optional[int] = None
+    source: Optional[str] = None
+    value: Optional[str] = None
+    batch: bool = False
+
+    def resolve(self, req) -> Optional[str]:
+        if self.source:
+            return str(getattr(req, self.source))
+        return self.value
+
+    def locator(self, page):
+        if self.css:
+            locator = page.locator(self.css)
+        elif self.role:
+            locator = page.get_by_role(self.role, name=self.name)
+        else:
+            locator = page.get_by_text(self.text)
+        if self.nth is not None:
+            locator = locator.nth(self.nth)
+        return locator
+
+
+@dataclass(frozen=True)
+class ReportForm:
+    """
+    Everything that differs between report types: the menu entry, the form
+    and the contract page. `ready` and `contract_ready` are the elements whose
+    readiness means the matching page can be filled.
+    """
+    kind: str
+    entry: Field
+    ready: str
+    fields: tuple
+    contract_ready: str
+    contract: tuple
+
+
+# Sets a batch of input/select values and fires the events the page's
+# validation listens to. Returns the selectors it could not apply.
+_BATCH_FILL_JS = """
+(fields) => {
+    const failed = [];
+    for (let [selector, value] of fields) {
+        const el = document.querySelector(selector);
+        if (!el || el.disabled) {
+            failed.push(selector);
+            continue;
+        }
+        if (el.tagName === "SELECT") {
+            // Like select_option: match the option by value or by label
+            const option = [...el.options].find(o => o.value === value || o.label === value || o.text === value);
+            if (!option) {
+                failed.push(`${selector} (no option ${value})`);
+                continue;
+            }
+            value = option.value;
+        }
+        const proto = el.tagName === "SELECT" ? HTMLSelectElement.prototype
+            : el.tagName === "TEXTAREA" ? HTMLTextAreaElement.prototype
+            : HTMLInputElement.prototype;
+        Object.getOwnPropertyDescriptor(proto, "value").set.call(el, value);
+        el.dispatchEvent(new Event("input", { bubbles: true }));
+        el.dispatchEvent(new Event("change", { bubbles: true }));
+    }
+    return failed;
+}
+"""
+
+# True once every given select has an option matching its value or label,
+# so options that load after the form renders are waited for, not missed.
+_OPTIONS_READY_JS = """
+(selects) => selects.every(([selector, value]) => {
+    const el = document.querySelector(selector);
+    return el && [...el.options].some(o => o.value === value || o.label === value || o.text === value);
+})
+"""
+
+
+async def wait_ready(page, css: str):
+    """Waits until `css` is visible and enabled, instead of the whole page's load event."""
+    await page.wait_for_selector(f"{css}:not([disabled])", state="visible")
+
+
+async def run_field(page, field: Field, req):
+    locator = field.locator(page)
+    target = field.css or field.name or field.text
+    with tracer.start_as_current_span(f"playwright.{field.action}", attributes={"rpa.field": target}):
+        if field.action == "fill":
+            await locator.fill(field.resolve(req))
+        elif field.action == "select":
+            await locator.select_option(field.resolve(req))
+        elif field.action == "press":
+            await locator.press(field.resolve(req))
+        elif field.action == "click":
+            await locator.click()
+        else:
+            raise ValueError(f"Unknown form action '{field.action}'")
+
+
+async def fill_fields(page, fields: tuple, req):
+    """
+    Applies `fields`: all batchable ones in a single page.evaluate first,
+    then the rest one locator at a time, in declaration order.
+    """
+    batch = [(f.css, f.resolve(req)) for f in fields if f.batch and f.action in ("fill", "select")]
+    if batch:
+        with tracer.start_as_current_span("playwright.batch_fill", attributes={"rpa.fields": len(batch)}):
+            selects = [(f.css, f.resolve(req)) for f in fields if f.batch and f.action == "select"]
+            if selects:
+                # select_option waited for its option; the batch must too
+                await page.wait_for_function(_OPTIONS_READY_JS, arg=selects)
+            failed = await page.evaluate(_BATCH_FILL_JS, batch)
+            if failed:
+                raise RuntimeError(f"Batch fill could not set: {', '.join(failed)}")
+    for field in fields:
+        if not (field.batch and field.action in ("fill", "select")):
+            await run_field(page, field, req)
+
+
+# --- REPORT FORM SPECS ---
+COMPANY_FORM = ReportForm(
+    kind="company",
+    entry=Field("click", role="link", name="Company", nth=2),
+    ready="#CompanyModel_PurposeOfEnquiry",
+    fields=(
+        Field("select", css="#CompanyModel_PurposeOfEnquiry", value="20", batch=True),
+        Field("fill", css="#CompanyModel_CompanyDataModel_MessageID", source="message_id", batch=True),
+        Field("fill", css="#CompanyModel_CompanyDataModel_TradeName", source="trade_name", batch=True),
+        Field("fill", role="textbox", name="FIELD 'ADDRESS' LENGTH IS NOT", source="address"),
+        Field("fill", role="textbox", name="FIELD 'SUB DISTRICT' IS", source="sub_district"),
+        Field("fill", role="textbox", name="FIELD 'DISTRICT' IS MANDATORY", source="district"),
+        Field("select", css="#CompanyModel_AddressDataModel_City", source="city_code", batch=True),
+        Field("fill", role="textbox", name="FIELD 'POSTAL CODE' IS", source="postal_code"),
+        Field("select", css="#CompanyModel_AddressDataModel_Country", value="ID", batch=True),
+        Field("fill", css="#CompanyModel_IdentificationCodeModel_BusniessNumber", source="business_number", batch=True),
+        Field("fill", role="textbox", name="AT LEAST ONE BETWEEN 'PHONE", source="phone"),
+        Field("click", text="Next"),
+    ),
+    contract_ready="#operationCombo",
+    contract=(
+        Field("select", css="#ContractModel_IndividualRole", value="B", batch=True),
+        # The operation options may be filled in by the role's change handler, and the
+        # credit section depends on the chosen operation, so both wait per locator
+        Field("select", css="#operationCombo", value="[[N99,F01],F01]"),
+        Field("fill", css="#ContractModel_ContractDataModelCredit_ApplicationAmount", value="100000000"),
+    ),
+)
+
+INDIVIDUAL_FORM = ReportForm(
+    kind="individual",
+    entry=Field("click", role="link", name="Individual", nth=0),
+    ready="#IndividualModel_PurposeOfEnquiry",
+    fields=(
+        Field("select", css="#IndividualModel_PurposeOfEnquiry", value="20", batch=True),
+        Field("fill", css="#IndividualModel_IndividualDataModel_MessageID", source="message_id", batch=True),
+        Field("fill", css="#IndividualModel_IndividualDataModel_NameAsId", source="name", batch=True),
+        # The date picker reacts to real keystrokes, so keep it on the locator path
+        Field("fill", role="textbox", name="YYYY/MM/DD", source="birth_date"),
+        Field("press", role="textbox", name="YYYY/MM/DD", value="Enter"),
+        Field("select", css="#IndividualModel_IndividualDataModel_GenderCode", source="gender", batch=True),
+        Field("fill", role="textbox", name="FIELD 'ADDRESS' LENGTH IS NOT", source="address"),
+        Field("fill", role="textbox", name="FIELD 'SUB DISTRICT' IS", source="sub_district"),
+        Field("fill", role="textbox", name="FIELD 'DISTRICT' IS MANDATORY", source="district"),
+        Field("select", css="#IndividualModel_AddressDataModel_City", source="city", batch=True),
+        Field("fill", role="textbox", name="FIELD 'POSTAL CODE' IS", source="postal_code"),
+        Field("select", css="#IndividualModel_AddressDataModel_Country", value="ID", batch=True),
+        Field("select", css="#IndividualModel_IdentificationCodeDataModel_Type", source="identity_type", batch=True),
+        Field("fill", css="#IndividualModel_IdentificationCodeDataModel_Id", source="id_number", batch=True),
+        Field("fill", css="#IndividualModel_ContactDataModel_PhoneNumber", source="phone_number", batch=True),
+        Field("click", text="Next"),
+    ),
+    contract_ready="#operationCombo",
+    contract=(
+        Field("select", css="#ContractModel_IndividualRole", value="B", batch=True),
+        Field("select", css="#operationCombo", value="[[P99,F01],F01]"),
+        Field("fill", css="#ContractModel_ContractDataModelCredit_ApplicationAmount", value="100000000"),
+    ),
+)
+
+REPORT_FORMS = {form.kind: form for form in (COMPANY_FORM, INDIVIDUAL_FORM)}
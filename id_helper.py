@@ -0,0 +1,243 @@
+import base64
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from metrics_helper import DB_SECONDS
+from tracing_helper import tracer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TYPE_CODE = os.getenv("MESSAGE_ID_TYPE_CODE", "FTICLI")
+# Type codes a caller may ask for; the default is always allowed
+TYPE_CODES = {code.strip() for code in os.getenv("MESSAGE_ID_TYPE_CODES", DEFAULT_TYPE_CODE).split(",") if code.strip()}
+TYPE_CODES.add(DEFAULT_TYPE_CODE)
+TYPE_CODE_PATTERN = re.compile(r"^[A-Z0-9]{1,10}$")
+
+# The counter is five digits, and each month starts again at 00001
+SEQUENCE_CAPACITY = 99999
+SEQUENCE_WARN_RATIO = float(os.getenv("MESSAGE_ID_WARN_RATIO", "0.9"))
+
+# SQLite before 3.32 allows at most 999 bound variables per statement
+IN_QUERY_CHUNK = 900
+
+MAPPING_COLUMNS = ["submission_id", "message_id", "created_at"]
+# Sorts after any other character, so prefix filters become index range scans
+_PREFIX_END = "\U0010ffff"
+
+
+class SequenceExhausted(Exception):
+    """Every counter value for this type code and month is already used."""
+
+
+class UnknownTypeCode(ValueError):
+    pass
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(row) -> str:
+    key = json.dumps([row["created_at"], row["submission_id"]])
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, submission_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(created_at), str(submission_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {str(e)}")
+
+
+def validate_type_code(type_code: str = None) -> str:
+    type_code = (type_code or DEFAULT_TYPE_CODE).strip().upper()
+    if not TYPE_CODE_PATTERN.match(type_code) or type_code not in TYPE_CODES:
+        raise UnknownTypeCode(f"Unknown message id type code '{type_code}'")
+    return type_code
+
+
+class MessageIdAllocator:
+    """
+    Maps submission ids to CLIK message ids ({counter:05d}{type}{MM}{YYYY}).
+    Counters live in id_sequences, one row per (type_code, year, month), so a
+    month never reuses a suffix another month minted and never wraps: when a
+    month is full allocation fails with SequenceExhausted.
+    Allocation is a single BEGIN IMMEDIATE transaction; the sequence is bumped
+    with one upsert ... RETURNING and the mapping inserted with ON CONFLICT DO
+    NOTHING, so concurrent requests (threads or processes) never mint the same
+    id twice.
+    """
+
+    def __init__(self, db, capacity: int = SEQUENCE_CAPACITY, warn_ratio: float = SEQUENCE_WARN_RATIO):
+        self.db = db
+        self.capacity = capacity
+        self.warn_at = int(capacity * warn_ratio)
+
+    @DB_SECONDS.labels("id_lookup").time()
+    @tracer.start_as_current_span("sqlite.id_lookup")
+    def lookup(self, submission_id: str):
+        row = self.db.connection().execute(
+            "SELECT message_id FROM id_mappings WHERE submission_id = ?", (submission_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _reserve(self, conn, type_code: str, year: int, month: int, count: int = 1) -> int:
+        """Reserves `count` consecutive counter values and returns the first one."""
+        rows = []
+        if count <= self.capacity:
+            rows = conn.execute(
+                """INSERT INTO id_sequences (type_code, year, month, last_val) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(type_code, year, month) DO UPDATE SET last_val = last_val + excluded.last_val
+                   WHERE last_val + excluded.last_val <= ?
+                   RETURNING last_val""",
+                (type_code, year, month, count, self.capacity)
+            ).fetchall()
+        if not rows:
+            raise SequenceExhausted(f"Not enough {type_code} message ids left for {month:02d}/{year} "
+                                    f"(capacity {self.capacity}, requested {count})")
+        last = rows[0][0]
+        first = last - count + 1
+        # Warn on reaching the threshold, then again every 1000 ids
+        if last >= self.warn_at and (first <= self.warn_at or (first - 1) // 1000 != last // 1000):
+            logger.warning(f"{type_code} message ids for {month:02d}/{year} are at {last}/{self.capacity}")
+        return first
+
+    def _existing(self, conn, submission_ids: list) -> dict:
+        mapped = {}
+        for start in range(0, len(submission_ids), IN_QUERY_CHUNK):
+            chunk = submission_ids[start:start + IN_QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT submission_id, message_id FROM id_mappings WHERE submission_id IN ({placeholders})",
+                chunk
+            ).fetchall()
+            mapped.update({row[0]: row[1] for row in rows})
+        return mapped
+
+    @DB_SECONDS.labels("id_allocate").time()
+    @tracer.start_as_current_span("sqlite.id_allocate")
+    def allocate(self, submission_id: str, type_code: str = DEFAULT_TYPE_CODE):
+        """Returns (message_id, is_new)."""
+        # Fast path without taking the write lock
+        existing = self.lookup(submission_id)
+        if existing:
+            return existing, False
+
+        now = datetime.now()
+        with self.db.transaction(immediate=True) as conn:
+            # Another writer may have mapped it between the lookup and BEGIN
+            row = conn.execute(
+                "SELECT message_id FROM id_mappings WHERE submission_id = ?", (submission_id,)
+            ).fetchone()
+            if row:
+                return row[0], False
+
+            next_val = self._reserve(conn, type_code, now.year, now.month)
+            message_id = f"{next_val:05d}{type_code}{now.month:02d}{now.year}"
+
+            inserted = conn.execute(
+                """INSERT INTO id_mappings (submission_id, message_id) VALUES (?, ?)
+                   ON CONFLICT(submission_id) DO NOTHING RETURNING message_id""",
+                (submission_id, message_id)
+            ).fetchall()
+            if not inserted:
+                # Unreachable under BEGIN IMMEDIATE, but never hand out an unsaved id
+                raise RuntimeError(f"Submission {submission_id} was mapped concurrently")
+        return message_id, True
+
+    @DB_SECONDS.labels("id_allocate_bulk").time()
+    @tracer.start_as_current_span("sqlite.id_allocate_bulk")
+    def allocate_many(self, submission_ids: list, type_code: str = DEFAULT_TYPE_CODE) -> list:
+        """
+        Bulk variant of allocate: returns (submission_id, message_id, is_new)
+        in input order. Existing mappings are resolved with chunked IN queries and
+        the missing ones get a contiguous counter range in one transaction.
+        A repeated submission id gets the same message id, new only the first time.
+        """
+        unique = list(dict.fromkeys(submission_ids))
+        mapped = self._existing(self.db.connection(), unique)
+        created = {}
+
+        missing = [sid for sid in unique if sid not in mapped]
+        if missing:
+            now = datetime.now()
+            with self.db.transaction(immediate=True) as conn:
+                # Re-check under the write lock for mappings made since the first query
+                mapped.update(self._existing(conn, missing))
+                missing = [sid for sid in missing if sid not in mapped]
+                if missing:
+                    first = self._reserve(conn, type_code, now.year, now.month, len(missing))
+                    for offset, sid in enumerate(missing):
+                        created[sid] = f"{first + offset:05d}{type_code}{now.month:02d}{now.year}"
+                    conn.executemany(
+                        """INSERT INTO id_mappings (submission_id, message_id) VALUES (?, ?)
+                           ON CONFLICT(submission_id) DO NOTHING""",
+                        list(created.items())
+                    )
+
+        results = []
+        for sid in submission_ids:
+            if sid in created:
+                # Only the first occurrence of a repeated id counts as new
+                mapped[sid] = created.pop(sid)
+                results.append((sid, mapped[sid], True))
+            else:
+                results.append((sid, mapped[sid], False))
+        return results
+
+    @DB_SECONDS.labels("id_mappings_page").time()
+    @tracer.start_as_current_span("sqlite.id_mappings_page")
+    def mappings(self, limit: int, after: tuple = None, submission_prefix: str = None,
+                 message_prefix: str = None, created_from: str = None, created_to: str = None) -> list:
+        """
+        One keyset page of id_mappings, newest first, read through the
+        (created_at, submission_id) index. `after` is the (created_at,
+        submission_id) of the last row of the previous page; created_* are
+        'YYYY-MM-DD HH:MM:SS' bounds in UTC, like CURRENT_TIMESTAMP.
+        """
+        where, params = [], []
+        if after is not None:
+            where.append("(created_at, submission_id) < (?, ?)")
+            params.extend(after)
+        if submission_prefix:
+            where.append("submission_id >= ? AND submission_id < ?")
+            params.extend([submission_prefix, submission_prefix + _PREFIX_END])
+        if message_prefix:
+            where.append("message_id >= ? AND message_id < ?")
+            params.extend([message_prefix, message_prefix + _PREFIX_END])
+        if created_from:
+            where.append("created_at >= ?")
+            params.append(created_from)
+        if created_to:
+            where.append("created_at < ?")
+            params.append(created_to)
+        # Forced: with a prefix filter SQLite would otherwise pick that column's
+        # index and sort every match again for each page
+        sql = "SELECT submission_id, message_id, created_at FROM id_mappings INDEXED BY idx_id_mappings_created"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC, submission_id DESC LIMIT ?"
+        return self.db.connection().execute(sql, params + [limit]).fetchall()
+
+    @DB_SECONDS.labels("id_sequences_usage").time()
+    @tracer.start_as_current_span("sqlite.id_sequences_usage")
+    def usage(self) -> list:
+        """Capacity used per sequence, current month first."""
+        rows = self.db.connection().execute(
+            "SELECT type_code, year, month, last_val FROM id_sequences ORDER BY year DESC, month DESC, type_code"
+        ).fetchall()
+        return [
+            {
+                "type_code": row["type_code"],
+                "year": row["year"],
+                "month": row["month"],
+                "used": row["last_val"],
+                "capacity": self.capacity,
+                "used_ratio": round(row["last_val"] / self.capacity, 4),
+                "near_limit": row["last_val"] >= self.warn_at,
+            }
+            for row in rows
+        ]
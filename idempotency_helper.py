@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from metrics_helper import DB_SECONDS
+from tracing_helper import tracer
+
+logger = logging.getLogger(__name__)
+
+# Where a returned result came from
+NEW = "new"
+JOINED = "joined"
+CACHED = "cached"
+
+
+class PayloadMismatch(Exception):
+    """The message_id was already used with different request fields."""
+
+
+def payload_hash(kind: str, payload: dict) -> str:
+    canonical = json.dumps({"kind": kind, "payload": payload}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ReportGuard:
+    """
+    Idempotency for report requests keyed by message_id.
+    An identical request that arrives while a run is in flight joins that run;
+    one that arrives after a success within `ttl_seconds` gets the stored
+    result. A different payload under the same message_id is rejected.
+    Results are kept in the report_results table of the db_helper Database `db`.
+    """
+
+    def __init__(self, db, ttl_seconds: int):
+        self.db = db
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._in_flight = {}
+
+    @DB_SECONDS.labels("report_cache_write").time()
+    @tracer.start_as_current_span("sqlite.report_cache_write")
+    def _save(self, message_id: str, kind: str, digest: str, status: str, result: dict = None, error: str = None):
+        with self.db.transaction() as conn:
+            conn.execute(
+                """INSERT INTO report_results (message_id, report_type, payload_hash, status, result, error, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(message_id) DO UPDATE SET
+                       report_type = excluded.report_type, payload_hash = excluded.payload_hash,
+                       status = excluded.status, result = excluded.result,
+                       error = excluded.error, updated_at = excluded.updated_at""",
+                (message_id, kind, digest, status, json.dumps(result) if result is not None else None,
+                 error, datetime.now().isoformat())
+            )
+
+    @DB_SECONDS.labels("report_cache_read").time()
+    @tracer.start_as_current_span("sqlite.report_cache_read")
+    def _cached(self, message_id: str):
+        row = self.db.connection().execute(
+            "SELECT payload_hash, status, result, updated_at FROM report_results WHERE message_id = ?",
+            (message_id,)
+        ).fetchone()
+        if row is None or row["status"] != "succeeded":
+            return None
+        if datetime.fromisoformat(row["updated_at"]) + self.ttl < datetime.now():
+            return None
+        return row["payload_hash"], json.loads(row["result"])
+
+    async def run(self, message_id: str, kind: str, payload: dict, runner):
+        """Returns (result, source) where source is NEW, JOINED or CACHED."""
+        digest = payload_hash(kind, payload)
+
+        in_flight = self._in_flight.get(message_id)
+        if in_flight is not None:
+            future, running_digest = in_flight
+            if running_digest != digest:
+                raise PayloadMismatch(f"message_id {message_id} is already running with different request fields")
+            logger.info(f"{kind} report {message_id} joined the run already in flight")
+            return await asyncio.shield(future), JOINED
+
+        # Register before the first await so concurrent duplicates see this run
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[message_id] = (future, digest)
+        try:
+            cached = await asyncio.to_thread(self._cached, message_id)
+            if cached is not None:
+                cached_digest, result = cached
+                if cached_digest != digest:
+                    raise PayloadMismatch(f"message_id {message_id} was already reported with different request fields")
+                logger.info(f"{kind} report {message_id} served from the result cache")
+                future.set_result(result)
+                return result, CACHED
+
+            await asyncio.to_thread(self._save, message_id, kind, digest, "running")
+            result = await runner()
+            await asyncio.to_thread(self._save, message_id, kind, digest, "succeeded", result)
+            future.set_result(result)
+            return result, NEW
+        except BaseException as e:
+            if not isinstance(e, PayloadMismatch):
+                error = getattr(e, "detail", None) or str(e)
+                await asyncio.to_thread(self._save, message_id, kind, digest, "failed", None, str(error))
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Nobody may have joined; mark the exception as retrieved
+                future.exception()
+            raise
+        finally:
+            self._in_flight.pop(message_id, None)
@@ -0,0 +1,87 @@
+import json
+import logging
+import urllib.request
+import uuid
+from datetime import datetime
+from metrics_helper import DB_SECONDS
+from tracing_helper import tracer
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobStore:
+    """
+    Persists asynchronous RPA jobs in the rpa_jobs table so they survive a restart.
+    The table itself is created by the db_helper migrations.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    @DB_SECONDS.labels("jobs_write").time()
+    @tracer.start_as_current_span("sqlite.jobs_write")
+    def _execute(self, sql: str, params: tuple):
+        with self.db.transaction() as conn:
+            conn.execute(sql, params)
+
+    def create(self, job_type: str, payload: dict, webhook_url: str = None) -> str:
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO rpa_jobs (job_id, job_type, status, payload, webhook_url) VALUES (?, ?, ?, ?, ?)",
+            (job_id, job_type, QUEUED, json.dumps(payload), webhook_url)
+        )
+        return job_id
+
+    def mark_running(self, job_id: str, queue_wait_seconds: float):
+        self._execute(
+            "UPDATE rpa_jobs SET status = ?, queue_wait_seconds = ?, started_at = ? WHERE job_id = ?",
+            (RUNNING, queue_wait_seconds, datetime.now().isoformat(), job_id)
+        )
+
+    def mark_succeeded(self, job_id: str, result: dict):
+        self._execute(
+            "UPDATE rpa_jobs SET status = ?, result = ?, finished_at = ? WHERE job_id = ?",
+            (SUCCEEDED, json.dumps(result), datetime.now().isoformat(), job_id)
+        )
+
+    def mark_failed(self, job_id: str, error: str):
+        self._execute(
+            "UPDATE rpa_jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?",
+            (FAILED, error, datetime.now().isoformat(), job_id)
+        )
+
+    @DB_SECONDS.labels("jobs_read").time()
+    @tracer.start_as_current_span("sqlite.jobs_read")
+    def get(self, job_id: str):
+        row = self.db.connection().execute("SELECT * FROM rpa_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def unfinished(self, status: str) -> list:
+        """Returns jobs left in `status` by a previous process, oldest first."""
+        rows = self.db.connection().execute(
+            "SELECT job_id FROM rpa_jobs WHERE status = ? ORDER BY created_at", (status,)
+        ).fetchall()
+        return [self.get(row["job_id"]) for row in rows]
+
+
+def post_webhook(url: str, body: dict, timeout: int = 10):
+    """Blocking JSON POST of a job result to the caller's webhook."""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status
@@ -0,0 +1,60 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Prometheus metrics for the RPA service, exported by GET /metrics.
+# Buckets follow what each thing actually costs: RPA steps take seconds to
+# minutes, SQLite calls take milliseconds.
+
+STEP_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 90, 120, 180, 300)
+UPLOAD_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+# --- RPA steps ---
+STEP_SECONDS = Histogram(
+    "rpa_step_duration_seconds", "Duration of one RPA step attempt",
+    ["kind", "step", "outcome"], buckets=STEP_BUCKETS
+)
+STEP_FAILURES = Counter(
+    "rpa_step_failures_total", "Failed RPA step attempts, retried or final",
+    ["kind", "step", "failure_class"]
+)
+REPORTS = Counter(
+    "rpa_reports_total", "Finished report runs",
+    ["kind", "profile", "outcome"]
+)
+REPORT_SECONDS = Histogram(
+    "rpa_report_duration_seconds", "End-to-end duration of a report run",
+    ["kind", "profile"], buckets=STEP_BUCKETS
+)
+
+# --- Browsers and queue ---
+BROWSER_ACQUIRE_SECONDS = Histogram(
+    "rpa_browser_acquire_seconds", "Wait for a pooled browser plus creating its context",
+    ["pool"], buckets=STEP_BUCKETS
+)
+BROWSERS_RUNNING = Gauge("rpa_browsers_running", "Launched Chromium processes", ["pool"])
+CONTEXTS_ACTIVE = Gauge("rpa_browser_contexts_active", "Browser contexts currently handed out", ["pool"])
+QUEUE_DEPTH = Gauge("rpa_queue_depth", "Report runs waiting for a scheduler slot", ["profile"])
+JOBS_RUNNING = Gauge("rpa_jobs_running", "Report runs holding a scheduler slot", ["profile"])
+
+# --- Drive uploads ---
+UPLOAD_SECONDS = Histogram(
+    "drive_upload_duration_seconds", "Drive upload including retries and the share permission",
+    ["file_type", "outcome"], buckets=UPLOAD_BUCKETS
+)
+UPLOAD_BYTES = Counter("drive_upload_bytes_total", "Bytes uploaded to Drive", ["file_type"])
+UPLOAD_RETRIES = Counter("drive_upload_retries_total", "Retried Drive requests", ["failure_class"])
+
+# --- Message ids and SQLite ---
+GENERATE_ID_SECONDS = Histogram(
+    "generate_id_duration_seconds", "Duration of /generate-id calls",
+    ["endpoint"], buckets=DB_BUCKETS
+)
+DB_SECONDS = Histogram(
+    "sqlite_query_duration_seconds", "Duration of SQLite operations",
+    ["operation"], buckets=DB_BUCKETS
+)
+
+
+def failure_class(error: Exception) -> str:
+    """Low-cardinality label for an exception, e.g. TimeoutError or HttpError."""
+    return type(error).__name__
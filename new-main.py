@@ -1,79 +1,43 @@
-from fastapi import FastAPI, HTTPException, status, Request, Depends
+from fastapi import FastAPI, HTTPException, status, Request, Depends, Response, Header
 import uvicorn, asyncio
-from playwright.async_api import async_playwright  
-from config import USERNAME, PASSWORD, LOGIN_URL, HEADLESS, BASE_URL
 import logging
 import time
 import os
+import io
+import csv
+import json
 from fastapi.security.api_key import APIKeyHeader
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from config_helper import load_settings, update_env
-from fastapi.responses import HTMLResponse, FileResponse
+from config_helper import load_settings, update_env, config_service, ConfigConflict, BASE_PROFILE
+from browser_helper import BrowserPool, ResourcePolicy
+from session_helper import SessionCache
+from scheduler_helper import JobScheduler, SchedulerFull
+from drive_helper import DriveClient, spool_file
+from flow_helper import Step, StepFailed, ReportRun, execute
+from form_helper import REPORT_FORMS, fill_fields, run_field, wait_ready
+from jobs_helper import JobStore, post_webhook, QUEUED, RUNNING
+from idempotency_helper import ReportGuard, PayloadMismatch
+from db_helper import Database
+from metrics_helper import GENERATE_ID_SECONDS, REPORTS, REPORT_SECONDS, QUEUE_DEPTH, JOBS_RUNNING
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from tracing_helper import tracer, setup_tracing
+from opentelemetry import trace
+from opentelemetry.propagate import extract
+from id_helper import (MessageIdAllocator, SequenceExhausted, UnknownTypeCode, validate_type_code,
+                       InvalidCursor, encode_cursor, decode_cursor, MAPPING_COLUMNS)
+from typing import Optional, List
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
 import sqlite3
-from contextlib import closing
-from datetime import datetime
-
-# --- GOOGLE DRIVE IMPORTS ---
-from google.auth.transport.requests import Request as GoogleRequest  
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-
-# --- GOOGLE DRIVE CONFIGURATION ---
-SHARED_DRIVE_FOLDER_ID = '1qIApzUHagAmouW0Q2p4R9R9Vwyhs8nxq' 
-SCOPES = ['https://www.googleapis.com/auth/drive'] 
-CREDENTIALS_FILE = 'credentials.json'
-TOKEN_FILE = 'token.json'
-
-# --- GOOGLE DRIVE AUTHENTICATION FUNCTION ---
-async def authenticate_user():
-    """Handles the OAuth 2.0 authentication flow."""
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(GoogleRequest())  
-        else:
-            print("Launching browser for initial authentication. Please sign in...")
-            flow = InstalledAppFlow.from_client_secrets_file(
-                CREDENTIALS_FILE, SCOPES)
-            creds = flow.run_local_server(port=0)
-        
-        with open(TOKEN_FILE, 'w') as token:
-            token.write(creds.to_json())
-            print(f"Authentication complete. Token saved to {TOKEN_FILE}.")
-    return creds
+from contextlib import asynccontextmanager, AsyncExitStack
+from datetime import datetime, timezone
 
 # --- GOOGLE DRIVE UPLOAD FUNCTION ---
-async def upload_to_drive(file_path: str, message_id: str):
-    credentials = await authenticate_user()
-    
-    def _do_upload():
-        service = build('drive', 'v3', credentials=credentials)
-        file_metadata = {
-            'name': os.path.basename(file_path),
-            'parents': [SHARED_DRIVE_FOLDER_ID]
-        }
-        media = MediaFileUpload(file_path, mimetype='application/pdf')
-        file = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id, webViewLink',
-            supportsAllDrives=True
-        ).execute()
-        service.permissions().create(
-            fileId=file['id'],
-            body={'type': 'anyone', 'role': 'reader'},
-            supportsAllDrives=True
-        ).execute()
-        return file['id'], file['webViewLink']
-
-    return await asyncio.to_thread(_do_upload)
+drive_client = DriveClient()
+
+async def upload_to_drive(fh, file_name: str, message_id: str):
+    return await asyncio.to_thread(drive_client.upload_stream, fh, file_name)
 
 
 app = FastAPI()
@@ -81,6 +45,202 @@ app = FastAPI()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# --- TRACING ---
+# TRACING_EXPORTER=otlp|console|file turns it on; spans are no-ops otherwise
+tracer_provider = setup_tracing()
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """One server span per request, continuing the caller's trace from its traceparent header."""
+    with tracer.start_as_current_span(
+        f"{request.method} {request.url.path}",
+        context=extract(request.headers),
+        kind=trace.SpanKind.SERVER,
+        attributes={"http.method": request.method, "http.target": request.url.path}
+    ) as span:
+        response = await call_next(request)
+        # Name the span after the route template (e.g. /jobs/{job_id}), not the concrete path
+        matched = request.scope.get("route")
+        route = matched.path if matched is not None else request.url.path
+        span.update_name(f"{request.method} {route}")
+        span.set_attribute("http.route", route)
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_status(trace.Status(trace.StatusCode.ERROR))
+        trace_id = span.get_span_context().trace_id
+        if trace_id:
+            response.headers["X-Trace-Id"] = format(trace_id, "032x")
+        return response
+
+@app.on_event("shutdown")
+def flush_traces():
+    if tracer_provider is not None:
+        tracer_provider.shutdown()
+
+# --- SHARED BROWSER POOLS ---
+resource_policy = ResourcePolicy(
+    allow_patterns=[p for p in os.getenv("RESOURCE_ALLOW_PATTERNS", "").split(",") if p]
+) if os.getenv("RESOURCE_BLOCKING", "True").lower() in ("1", "true", "yes") else None
+
+# Report types that load every resource (comma separated), for debugging a flow
+RESOURCE_BLOCKING_OFF = {k.strip() for k in os.getenv("RESOURCE_BLOCKING_OFF", "").split(",") if k.strip()}
+
+# --- AUTHENTICATED CLIK SESSIONS ---
+# Keyed by login URL and credentials, so each profile keeps its own sessions
+session_cache = SessionCache()
+
+# --- ENVIRONMENT PROFILES ---
+# UAT reads the unsuffixed config keys, PROD the *_PROD ones. A request picks
+# its profile with the X-RPA-Profile header or a "profile" field.
+RPA_PROFILES = [p.strip().upper() for p in os.getenv("RPA_PROFILES", "UAT,PROD").split(",") if p.strip()]
+DEFAULT_PROFILE = os.getenv("RPA_DEFAULT_PROFILE", BASE_PROFILE).upper()
+
+def profile_env(profile: str, key: str, default: str) -> str:
+    """Per-profile override of a tuning variable, e.g. BROWSER_POOL_SIZE_PROD over BROWSER_POOL_SIZE."""
+    return os.getenv(f"{key}_{profile}", os.getenv(key, default))
+
+class ProfileRuntime:
+    """
+    Browser pools and scheduler of one environment profile, so UAT smoke
+    checks and PROD traffic share a process without waiting on, or
+    cold-starting, each other.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        max_uses = int(profile_env(name, "BROWSER_MAX_USES", "50"))
+        # Production jobs always run headless
+        self.browser_pool = BrowserPool(
+            size=int(profile_env(name, "BROWSER_POOL_SIZE", "2")),
+            max_uses=max_uses,
+            headless=True,
+            resource_policy=resource_policy,
+            name=name
+        )
+        # Small headed pool for watching a flow live; started on first use since it needs a display
+        self.debug_pool = BrowserPool(
+            size=int(profile_env(name, "DEBUG_POOL_SIZE", "1")),
+            max_uses=max_uses,
+            headless=False,
+            resource_policy=resource_policy,
+            name=f"{name}-debug"
+        )
+        # Don't retry launching the headed pool on every job once it failed (e.g. no X server)
+        self.debug_pool_retry_at = 0.0
+        self.scheduler = JobScheduler(
+            global_limit=int(profile_env(name, "RPA_MAX_CONCURRENCY", "2")),
+            type_limits={
+                "company": int(profile_env(name, "RPA_MAX_COMPANY", "2")),
+                "individual": int(profile_env(name, "RPA_MAX_INDIVIDUAL", "2")),
+            },
+            max_queue_depth=int(profile_env(name, "RPA_MAX_QUEUE", "20"))
+        )
+
+profiles = {name: ProfileRuntime(name) for name in RPA_PROFILES}
+
+def resolve_profile(req: BaseModel, x_rpa_profile: Optional[str] = None) -> ProfileRuntime:
+    """Picks the request's profile (header, then field, then default) and records it on `req`."""
+    name = (x_rpa_profile or req.profile or DEFAULT_PROFILE).strip().upper()
+    if req.profile and req.profile.strip().upper() != name:
+        raise HTTPException(status_code=400, detail=f"X-RPA-Profile {name} does not match profile field {req.profile}")
+    if name not in profiles:
+        raise HTTPException(status_code=400, detail=f"Unknown profile '{name}', expected one of {', '.join(profiles)}")
+    if not config_service.snapshot().profile(name).configured:
+        raise HTTPException(status_code=400, detail=f"Profile {name} has no complete credentials in config.py")
+    req.profile = name
+    return profiles[name]
+
+def guard_key(profile: str, message_id: str) -> str:
+    """
+    Idempotency key. UAT keeps the bare message_id used before profiles existed;
+    this is tied to BASE_PROFILE, not RPA_DEFAULT_PROFILE, so changing the default
+    never hands another profile's cached results back.
+    """
+    return message_id if profile == BASE_PROFILE else f"{profile}:{message_id}"
+
+def queue_full(runtime: ProfileRuntime) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=f"RPA queue for {runtime.name} is full ({runtime.scheduler.max_queue_depth} jobs waiting)",
+        headers={"Retry-After": "30"}
+    )
+
+async def run_scheduled(runtime: ProfileRuntime, job_type: str, response: Response, run):
+    """Runs `run()` once the profile's scheduler admits it, reporting queue wait in a response header."""
+    try:
+        async with runtime.scheduler.slot(job_type) as queue_wait:
+            response.headers["X-Queue-Wait-Seconds"] = f"{queue_wait:.3f}"
+            return await run()
+    except SchedulerFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "30"}
+        )
+
+async def run_idempotent(kind: str, req: BaseModel, response: Response, run):
+    """Joins an identical in-flight report or returns a cached one before running `run()`."""
+    span = trace.get_current_span()
+    span.set_attribute("rpa.message_id", req.message_id)
+    span.set_attribute("rpa.profile", req.profile)
+    try:
+        result, source = await report_guard.run(guard_key(req.profile, req.message_id), kind,
+                                                req.dict(exclude={"profile"}), run)
+    except PayloadMismatch as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    response.headers["X-Idempotent-Result"] = source
+    span.set_attribute("rpa.idempotent_result", source)
+    span.set_attribute("rpa.attempt", result["attempt"])
+    return result
+
+@app.on_event("startup")
+async def start_browser_pool():
+    # Every configured profile starts warm
+    settings = config_service.snapshot()
+    for runtime in profiles.values():
+        if settings.profile(runtime.name).configured:
+            await runtime.browser_pool.start()
+
+@app.on_event("shutdown")
+async def stop_browser_pool():
+    for runtime in profiles.values():
+        await runtime.browser_pool.stop()
+        await runtime.debug_pool.stop()
+
+def wants_debug(x_rpa_debug: Optional[str]) -> bool:
+    """A job goes headed when the request asks for it or the admin turned HEADLESS off."""
+    if x_rpa_debug is not None:
+        return x_rpa_debug.lower() in ("1", "true", "yes")
+    return not config_service.snapshot().HEADLESS
+
+DEBUG_POOL_RETRY_SECONDS = 300
+
+async def choose_pool(run: ReportRun) -> BrowserPool:
+    """Routes debug runs to the profile's headed pool while it has room; everything else runs headless."""
+    runtime = profiles[run.options["profile"]]
+    if run.options.get("debug") and time.monotonic() >= runtime.debug_pool_retry_at:
+        try:
+            await runtime.debug_pool.start()
+        except Exception as e:
+            runtime.debug_pool_retry_at = time.monotonic() + DEBUG_POOL_RETRY_SECONDS
+            logger.warning(f"Headed {runtime.name} debug pool unavailable, running headless: {str(e)}")
+            return runtime.browser_pool
+        if runtime.debug_pool.has_idle():
+            logger.info(f"{run.kind} report {run.req.message_id} running in the headed {runtime.name} debug pool")
+            return runtime.debug_pool
+    # No-op once started; covers a profile whose credentials were added after startup
+    await runtime.browser_pool.start()
+    return runtime.browser_pool
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint; async so scheduler state is read on the loop that owns it."""
+    for runtime in profiles.values():
+        stats = runtime.scheduler.stats()
+        QUEUE_DEPTH.labels(runtime.name).set(stats["queued"])
+        JOBS_RUNNING.labels(runtime.name).set(stats["running"])
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to RPA Click for FTI Credit Analyst ver. 1.2"}
@@ -96,123 +256,16 @@ class CompanyRequest(BaseModel):
     postal_code: str 
     business_number: str 
     phone: str 
+    profile: Optional[str] = None  # UAT / PROD, defaults to RPA_DEFAULT_PROFILE
 
 @app.post("/get_company")
-async def get_company(req: CompanyRequest) -> str:
-    playwright = None
-    browser = None
-    context = None
-    page = None   
-    max_retries = 3
-    base_delay = 5
-    last_error = None
-    pdf_filename = None
-
-    for attempt in range(0, max_retries):
-        try:
-            playwright = await async_playwright().start()
-            browser = await playwright.chromium.launch(headless=False) 
-            context = await browser.new_context()
-            page = await context.new_page()
-
-            # --- RPA steps (example using req fields) ---
-            await page.goto(LOGIN_URL)
-            await page.wait_for_load_state("load")
-            await page.get_by_role("button", name="").click()
-            await page.get_by_role("link", name="English").click()
-
-            await page.wait_for_load_state("load")
-            await page.get_by_role("textbox", name="Username").fill(USERNAME)
-            await page.get_by_role("textbox", name="Password").fill(PASSWORD)
-            await page.get_by_role("button", name="Login").click()
-
-            await page.wait_for_load_state("load")
-            await page.get_by_role("link", name="Company").nth(2).click()
-
-            await page.wait_for_load_state("load")
-            await page.locator("#CompanyModel_PurposeOfEnquiry").select_option("20")
-            await page.locator("#CompanyModel_CompanyDataModel_MessageID").fill(req.message_id)
-            await page.locator("#CompanyModel_CompanyDataModel_TradeName").fill(req.trade_name)
-            await page.get_by_role("textbox", name="FIELD 'ADDRESS' LENGTH IS NOT").fill(req.address)
-            await page.get_by_role("textbox", name="FIELD 'SUB DISTRICT' IS").fill(req.sub_district)
-            await page.get_by_role("textbox", name="FIELD 'DISTRICT' IS MANDATORY").fill(req.district)
-            await page.locator("#CompanyModel_AddressDataModel_City").select_option(req.city_code)
-            await page.get_by_role("textbox", name="FIELD 'POSTAL CODE' IS").fill(req.postal_code)
-            await page.locator("#CompanyModel_AddressDataModel_Country").select_option("ID")            
-            await page.locator("#CompanyModel_IdentificationCodeModel_BusniessNumber").fill(req.business_number)
-            await page.get_by_role("textbox", name="AT LEAST ONE BETWEEN 'PHONE").fill(req.phone)
-            await page.get_by_text("Next").click()
-
-            await page.wait_for_load_state("load")
-            await page.locator("#ContractModel_IndividualRole").select_option("B")
-            await page.locator("#operationCombo").select_option("[[N99,F01],F01]")
-            await page.locator("#ContractModel_ContractDataModelCredit_ApplicationAmount").fill("100000000")
-            await page.get_by_text("Submit").click()
-
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            html_filename = f"{req.message_id}_company_{timestamp}.html"
-
-            # --- Save current HTML view ---
-            await page.wait_for_load_state("load")
-            html_content = await page.content()
-            with open(html_filename, "w", encoding="utf-8") as f:
-                f.write(html_content)
-            logger.info(f"HTML successfully saved locally as: {html_filename}")
-
-            # --- CALL GOOGLE DRIVE UPLOAD ---
-            file_id, web_link02 = await upload_to_drive(html_filename, req.message_id)
-
-            # --- Cleanup ---
-            if os.path.exists(html_filename):
-                os.remove(html_filename)
-                logger.info(f"Local file {html_filename} removed.")            
-
-            await page.wait_for_load_state("load")
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            pdf_filename = f"{req.message_id}_company_{timestamp}.pdf"
-
-            # --- PDF Download ---
-            page.set_default_timeout(120000)
-            async with page.expect_download() as download_info:
-                await page.get_by_role("link", name=" View PDF").click()
-            
-            download = await download_info.value
-            await download.save_as(pdf_filename)
-            logger.info(f"PDF successfully saved locally as: {pdf_filename}")
-            
-            # --- CALL GOOGLE DRIVE UPLOAD ---
-            file_id, web_link01 = await upload_to_drive(pdf_filename, req.message_id)
-            
-            # --- Cleanup ---
-            if os.path.exists(pdf_filename):
-                os.remove(pdf_filename)
-                logger.info(f"Local file {pdf_filename} removed.")
-
-            await context.close()
-            await browser.close()
-            await playwright.stop()
-
-            return f"Company RPA completed successfully on POST methode at attempt #{attempt+1}. Drive Link: {web_link01}. Html Link: {web_link02}"
-
-        except Exception as e:
-            last_error = e
-            logger.error(f"Attempt {attempt+1} failed: {str(e)}")
-            if context:
-                await context.close()
-            if browser:
-                await browser.close()
-            if playwright:
-                await playwright.stop()
-            if attempt < max_retries - 1:
-                delay = base_delay * (2 ** attempt)
-                await asyncio.sleep(delay)
-
-    # If all attempts failed
-    logger.error("All retry attempts on Company report failed")
-    raise HTTPException(
-        status_code=500, 
-        detail=f"Company report failed after {max_retries} attempts. Last error: {str(last_error)}"
-    )
+async def get_company(req: CompanyRequest, response: Response, x_rpa_debug: Optional[str] = Header(None),
+                      x_rpa_profile: Optional[str] = Header(None)) -> str:
+    debug = wants_debug(x_rpa_debug)
+    runtime = resolve_profile(req, x_rpa_profile)
+    result = await run_idempotent("company", req, response,
+                                  lambda: run_scheduled(runtime, "company", response, lambda: run_company_report(req, debug)))
+    return f"Company RPA completed successfully on POST methode at attempt #{result['attempt']}. Drive Link: {result['pdf_link']}. Html Link: {result['html_link']}"
 
 class IndividualRequest(BaseModel):
     message_id: str
@@ -227,133 +280,198 @@ class IndividualRequest(BaseModel):
     identity_type: str
     id_number: str
     phone_number: str
+    profile: Optional[str] = None  # UAT / PROD, defaults to RPA_DEFAULT_PROFILE
 
 @app.post("/get_individual")
-async def get_individual(req: IndividualRequest) -> str:
-    playwright = None
-    browser = None
-    context = None
-    page = None   
-    max_retries = 3
-    base_delay = 5 
-    last_error = None
-    pdf_filename = None
-    
-    for attempt in range(0, max_retries):
-        try:
-            playwright = await async_playwright().start()
-            browser = await playwright.chromium.launch(headless=HEADLESS)
-            context = await browser.new_context()
-            page = await context.new_page()
-            
-            # --- RPA steps ---
-            await page.goto(LOGIN_URL)
-            await page.wait_for_load_state("load")
-            await page.get_by_role("button", name="").click()
-            await page.get_by_role("link", name="English").click()
-            
-            await page.wait_for_load_state("load")
-            await page.get_by_role("textbox", name="Username").fill(USERNAME)
-            await page.get_by_role("textbox", name="Password").fill(PASSWORD)
-            await page.get_by_role("button", name="Login").click()
-
-            await page.wait_for_load_state("load")
-            await page.get_by_role("link", name="Individual").first.click()
-
-            await page.wait_for_load_state("load")
-            await page.locator("#IndividualModel_PurposeOfEnquiry").select_option("20")
-            await page.locator("#IndividualModel_IndividualDataModel_MessageID").fill(req.message_id)
-            await page.locator("#IndividualModel_IndividualDataModel_NameAsId").fill(req.name)
-            await page.get_by_role("textbox", name="YYYY/MM/DD").fill(req.birth_date)
-            await page.get_by_role("textbox", name="YYYY/MM/DD").press("Enter")
-            await page.locator("#IndividualModel_IndividualDataModel_GenderCode").select_option(req.gender)
-            await page.get_by_role("textbox", name="FIELD 'ADDRESS' LENGTH IS NOT").fill(req.address)
-            await page.get_by_role("textbox", name="FIELD 'SUB DISTRICT' IS").fill(req.sub_district)
-            await page.get_by_role("textbox", name="FIELD 'DISTRICT' IS MANDATORY").fill(req.district)
-            await page.locator("#IndividualModel_AddressDataModel_City").select_option(req.city)
-            await page.get_by_role("textbox", name="FIELD 'POSTAL CODE' IS").fill(req.postal_code)
-            await page.locator("#IndividualModel_AddressDataModel_Country").select_option("ID")
-            await page.locator("#IndividualModel_IdentificationCodeDataModel_Type").select_option(req.identity_type)
-            await page.locator("#IndividualModel_IdentificationCodeDataModel_Id").fill(req.id_number)
-            await page.locator("#IndividualModel_ContactDataModel_PhoneNumber").fill(req.phone_number)
-            await page.get_by_text("Next").click()
-
-            await page.wait_for_load_state("load")
-            await page.locator("#ContractModel_IndividualRole").select_option("B")
-            await page.locator("#operationCombo").select_option("[[P99,F01],F01]")
-            await page.locator("#ContractModel_ContractDataModelCredit_ApplicationAmount").fill("100000000")
-            await page.get_by_text("Submit").click()
-
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            html_filename = f"{req.message_id}_individual_{timestamp}.html"
-
-            # --- Save current HTML view ---
-            await page.wait_for_load_state("load")
-            html_content = await page.content()
-            with open(html_filename, "w", encoding="utf-8") as f:
-                f.write(html_content)
-            logger.info(f"HTML successfully saved locally as: {html_filename}")
-
-            # --- CALL GOOGLE DRIVE UPLOAD ---
-            file_id, web_link02 = await upload_to_drive(html_filename, req.message_id)
-
-            # --- Cleanup ---
-            if os.path.exists(html_filename):
-                os.remove(html_filename)
-                logger.info(f"Local file {html_filename} removed.")             
-
-            await page.wait_for_load_state("load")
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            pdf_filename = f"{req.message_id}_individual_{timestamp}.pdf"
-
-            # --- PDF Download ---
-            page.set_default_timeout(120000)
-            async with page.expect_download() as download_info:
-                await page.get_by_role("link", name=" View PDF").click()
-            
-            download = await download_info.value
-            await download.save_as(pdf_filename)
-            logger.info(f"PDF successfully saved locally as: {pdf_filename}")
-            
-            # --- CALL GOOGLE DRIVE UPLOAD ---
-            file_id, web_link01 = await upload_to_drive(pdf_filename, req.message_id)
-            
-            # --- Cleanup ---
-            if os.path.exists(pdf_filename):
-                os.remove(pdf_filename)
-                logger.info(f"Local file {pdf_filename} removed.")
-
-            await context.close()
-            await browser.close()
-            await playwright.stop()
-            
-            logger.info(f"Attempt {attempt+1} succeeded")
-            return f"Individual RPA completed successfully on POST method at attempt #{attempt+1}. Drive Link: {web_link01}. Html Link: {web_link02}"
+async def get_individual(req: IndividualRequest, response: Response, x_rpa_debug: Optional[str] = Header(None),
+                         x_rpa_profile: Optional[str] = Header(None)) -> str:
+    debug = wants_debug(x_rpa_debug)
+    runtime = resolve_profile(req, x_rpa_profile)
+    result = await run_idempotent("individual", req, response,
+                                  lambda: run_scheduled(runtime, "individual", response, lambda: run_individual_report(req, debug)))
+    return f"Individual RPA completed successfully on POST method at attempt #{result['attempt']}. Drive Link: {result['pdf_link']}. Html Link: {result['html_link']}"
 
-        except Exception as e:
-            last_error = e
-            logger.error(f"Attempt {attempt+1} failed: {str(e)}")
-            
-            if page:
-                await page.screenshot(path=f"ss-indv-error-attempt{attempt+1}.png")
-            if context:
-                await context.close()
-            if browser:
-                await browser.close()
-            if playwright:
-                await playwright.stop()
-            
-            if attempt < max_retries - 1:
-                delay = base_delay * (2 ** attempt)
-                logger.info(f"Retrying in {delay} seconds...")
-                await asyncio.sleep(delay)
-    
-    # If all attempts failed
-    logger.error("All retry attempts on Individual report failed")
-    raise HTTPException(
-        status_code=500, 
-        detail=f"Individual report failed after {max_retries} attempts. Last error: {str(last_error)}"
-    )
+# --- RPA REPORT FLOW (checkpointed steps) ---
+# Each run keeps its profile's credentials as of when it started (run.options["settings"]),
+# so a PUT /config mid-run never mixes old and new credentials
+def run_session_key(run: ReportRun) -> str:
+    cfg = run.options["settings"]
+    return session_cache.key(cfg.LOGIN_URL, cfg.USERNAME, cfg.PASSWORD)
+
+async def ensure_run_session(run: ReportRun):
+    cfg = run.options["settings"]
+    await session_cache.ensure_logged_in(run.page, run_session_key(run), cfg.LOGIN_URL, cfg.BASE_URL,
+                                         cfg.USERNAME, cfg.PASSWORD)
+
+@asynccontextmanager
+async def open_report_context(run: ReportRun):
+    session_key = run_session_key(run)
+    pool = await choose_pool(run)
+    async with pool.context(
+        block_resources=run.kind not in RESOURCE_BLOCKING_OFF,
+        storage_state=session_cache.state_for(session_key)
+    ) as context:
+        yield context
+
+async def resume_report_page(run: ReportRun):
+    """After the report was submitted, a fresh page goes straight back to its result."""
+    if run.result_url:
+        await ensure_run_session(run)
+        with tracer.start_as_current_span("playwright.goto", attributes={"http.url": run.result_url}):
+            await run.page.goto(run.result_url, wait_until="domcontentloaded")
+            await view_pdf_link(run.page).wait_for(state="visible")
+
+def view_pdf_link(page):
+    return page.get_by_role("link", name=" View PDF")
+
+async def step_login(run: ReportRun):
+    await ensure_run_session(run)
+
+async def step_form_fill(run: ReportRun):
+    form = REPORT_FORMS[run.kind]
+    await run_field(run.page, form.entry, run.req)
+    await wait_ready(run.page, form.ready)
+    await fill_fields(run.page, form.fields, run.req)
+
+async def step_contract(run: ReportRun):
+    form = REPORT_FORMS[run.kind]
+    await wait_ready(run.page, form.contract_ready)
+    await fill_fields(run.page, form.contract, run.req)
+
+async def step_submit(run: ReportRun):
+    page = run.page
+    submit = page.get_by_text("Submit")
+    await submit.wait_for(state="visible")
+    # Fence before the click: a click that times out on the navigation may
+    # still have sent the inquiry, and from then on it is billed. A click
+    # that never landed fails the run instead of risking a second one.
+    run.submitted = True
+    await submit.click()
+    # The result page is ready once its PDF link is; images and scripts may still load
+    await view_pdf_link(page).wait_for(state="visible")
+    run.result_url = page.url
+
+def upload_failed(task: asyncio.Task) -> bool:
+    return task.done() and (task.cancelled() or task.exception() is not None)
+
+def consume_upload_error(task: asyncio.Task):
+    # Retrieves the error of an upload nobody awaits any more; step_upload
+    # still sees it when it does await the task
+    if not task.cancelled():
+        task.exception()
+
+def html_upload(run: ReportRun) -> asyncio.Task:
+    """
+    Returns the run's HTML upload, starting one only if none is pending or done.
+    Cancelling the task would not stop its to_thread upload, so a pending one is
+    always reused rather than replaced.
+    """
+    upload = run.artifacts.get("html_upload")
+    if upload is None or upload_failed(upload):
+        upload = asyncio.create_task(
+            upload_to_drive(io.BytesIO(run.artifacts["html"]), run.artifacts["html_name"], run.req.message_id)
+        )
+        upload.add_done_callback(consume_upload_error)
+        run.artifacts["html_upload"] = upload
+    return upload
+
+async def step_capture_html(run: ReportRun):
+    upload = run.artifacts.get("html_upload")
+    if upload is not None and not upload_failed(upload):
+        # A retry after the upload started: that HTML is already on its way to Drive
+        return
+    page = run.page
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    html_filename = f"{run.req.message_id}_{run.kind}_{timestamp}.html"
+
+    # --- Capture current HTML view ---
+    html_content = await page.content()
+    run.artifacts["html"] = html_content.encode("utf-8")
+    run.artifacts["html_name"] = html_filename
+    logger.info(f"HTML captured in memory as: {html_filename}")
+
+    # --- Upload the HTML in the background while the PDF downloads ---
+    html_upload(run)
+
+async def step_download_pdf(run: ReportRun):
+    page = run.page
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    pdf_filename = f"{run.req.message_id}_{run.kind}_{timestamp}.pdf"
+
+    # --- PDF Download ---
+    async with page.expect_download() as download_info:
+        await view_pdf_link(page).click()
+
+    download = await download_info.value
+    # Playwright removes its download artifact with the context, so take it now
+    run.artifacts["pdf"] = await asyncio.to_thread(spool_file, await download.path())
+    run.artifacts["pdf_name"] = pdf_filename
+    logger.info(f"PDF captured as: {pdf_filename}")
+
+async def step_upload(run: ReportRun):
+    """Finishes the HTML upload and uploads the PDF; the browser is already released."""
+    message_id = run.req.message_id
+
+    async def _html():
+        if "html_link" not in run.artifacts:
+            _, run.artifacts["html_link"] = await html_upload(run)
+
+    async def _pdf():
+        if "pdf_link" not in run.artifacts:
+            run.artifacts["pdf"].seek(0)
+            _, run.artifacts["pdf_link"] = await upload_to_drive(run.artifacts["pdf"], run.artifacts["pdf_name"], message_id)
+
+    await asyncio.gather(_html(), _pdf())
+
+REPORT_STEPS = [
+    Step("login", step_login, max_attempts=3, base_delay=5, timeout=30000),
+    Step("form_fill", step_form_fill, max_attempts=3, base_delay=5, restart_from="login", timeout=30000),
+    Step("contract", step_contract, max_attempts=3, base_delay=5, restart_from="login", timeout=30000),
+    Step("submit", step_submit, max_attempts=3, base_delay=5, restart_from="login", timeout=60000),
+    Step("capture_html", step_capture_html, max_attempts=3, timeout=15000),
+    Step("download_pdf", step_download_pdf, max_attempts=3, base_delay=5, timeout=120000),
+    # Drive retries inside each upload; this only covers a final upload error
+    Step("upload", step_upload, max_attempts=2, base_delay=5, needs_page=False),
+]
+
+async def run_report(kind: str, req, debug: bool = False, open_context=open_report_context) -> dict:
+    profile = req.profile or DEFAULT_PROFILE
+    run = ReportRun(kind, req, open_context, resume_report_page,
+                    {"debug": debug, "profile": profile, "settings": config_service.snapshot().profile(profile)})
+    started = time.monotonic()
+    try:
+        await execute(run, REPORT_STEPS)
+    except StepFailed as e:
+        REPORTS.labels(kind, profile, f"failed_{e.step}").inc()
+        logger.error(f"{kind.capitalize()} report {req.message_id} failed at step '{e.step}': {str(e.error)}")
+        if e.step == "upload":
+            raise HTTPException(
+                status_code=502,
+                detail=f"{kind.capitalize()} report captured but Drive upload failed: {str(e.error)}"
+            )
+        raise HTTPException(
+            status_code=500,
+            detail=f"{kind.capitalize()} report failed at step '{e.step}'. Last error: {str(e.error)}"
+        )
+    finally:
+        # A pending HTML upload is left to finish; consume_upload_error retrieves its error
+        await run.close()
+
+    REPORTS.labels(kind, profile, "succeeded").inc()
+    REPORT_SECONDS.labels(kind, profile).observe(time.monotonic() - started)
+    logger.info(f"{kind.capitalize()} report {req.message_id} completed after {run.failures} retried step(s), step timings: {run.timings}")
+    return {
+        "attempt": run.failures + 1,
+        "pdf_link": run.artifacts["pdf_link"],
+        "html_link": run.artifacts["html_link"],
+        "timings": run.timings
+    }
+
+async def run_company_report(req: CompanyRequest, debug: bool = False) -> dict:
+    return await run_report("company", req, debug)
+
+async def run_individual_report(req: IndividualRequest, debug: bool = False) -> dict:
+    return await run_report("individual", req, debug)
 
 # ''' Message ID Database ---
 DB_NAME = "reg_data.db"
@@ -361,76 +479,398 @@ DB_NAME = "reg_data.db"
 # --- Pydantic Models ---
 class MessageIdRequest(BaseModel):
     submission_id: str
+    type_code: Optional[str] = None  # defaults to MESSAGE_ID_TYPE_CODE (FTICLI)
 
 class MessageIdResponse(BaseModel):
     message_id: str
     is_new: bool
 
+class BulkMessageIdRequest(BaseModel):
+    submission_ids: List[str]
+    type_code: Optional[str] = None
+
+class BulkMessageIdItem(BaseModel):
+    submission_id: str
+    message_id: str
+    is_new: bool
+
+class BulkMessageIdResponse(BaseModel):
+    results: List[BulkMessageIdItem]
+    created: int
+    existing: int
+
 # --- Initial Database Setup ---
+# One managed connection per worker thread (WAL, busy timeout); the schema for
+# every table in reg_data.db is migrated once here instead of per request
+db = Database(DB_NAME, busy_timeout_ms=int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")))
+
+@app.on_event("startup")
 def init_db():
-    with closing(sqlite3.connect(DB_NAME)) as conn:
-        with closing(conn.cursor()) as cursor:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS id_mappings (
-                    submission_id TEXT PRIMARY KEY,
-                    message_id TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS counter_state (
-                    id INTEGER PRIMARY KEY,
-                    last_val INTEGER NOT NULL
-                )
-            """)
-            cursor.execute("INSERT OR IGNORE INTO counter_state (id, last_val) VALUES (1, 0)")
-            conn.commit()
+    db.migrate()
+
+@app.on_event("shutdown")
+def close_db():
+    db.close_all()
+
+id_allocator = MessageIdAllocator(db)
 
 # --- Core Logic (Changed to POST) ---
 @app.post("/generate-id", response_model=MessageIdResponse)
 def get_or_create_message_id(request: MessageIdRequest):
+    with GENERATE_ID_SECONDS.labels("single").time():
+        clean_submission_id = request.submission_id.strip()
     
-    clean_submission_id = request.submission_id.strip()
-    
-    if not clean_submission_id:
-        raise HTTPException(status_code=400, detail="Submission ID cannot be empty")
-
-    with closing(sqlite3.connect(DB_NAME)) as conn:
-        with closing(conn.cursor()) as cursor:
-            
-            # 1. CHECK
-            cursor.execute("SELECT message_id FROM id_mappings WHERE submission_id = ?", (clean_submission_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                return MessageIdResponse(message_id=row[0], is_new=False)
-            
-            # 2. CREATE
-            try:
-                cursor.execute("SELECT last_val FROM counter_state WHERE id = 1")
-                current_val = cursor.fetchone()[0]
-                
-                next_val = (current_val % 99999) + 1
-                
-                counter_string = f"{next_val:05d}"
-                now = datetime.now()
-                month = now.strftime("%m")
-                year = now.strftime("%Y")
-                type_code = "FTICLI"
-                
-                new_message_id = f"{counter_string}{type_code}{month}{year}"
-                
-                cursor.execute("UPDATE counter_state SET last_val = ? WHERE id = 1", (next_val,))
-                cursor.execute("INSERT INTO id_mappings (submission_id, message_id) VALUES (?, ?)", 
-                               (clean_submission_id, new_message_id))
-                conn.commit()
-                
-                return MessageIdResponse(message_id=new_message_id, is_new=True)
-                
-            except Exception as e:
-                print(e)
-                conn.rollback()
-                raise HTTPException(status_code=500, detail=str(e))
+        if not clean_submission_id:
+            raise HTTPException(status_code=400, detail="Submission ID cannot be empty")
+
+        try:
+            type_code = validate_type_code(request.type_code)
+        except UnknownTypeCode as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        try:
+            message_id, is_new = id_allocator.allocate(clean_submission_id, type_code)
+        except SequenceExhausted as e:
+            logger.error(str(e))
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+        except sqlite3.Error as e:
+            logger.error(f"Message ID allocation failed: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+        return MessageIdResponse(message_id=message_id, is_new=is_new)
+
+GENERATE_ID_BULK_MAX = int(os.getenv("GENERATE_ID_BULK_MAX", "1000"))
+
+@app.post("/generate-id/bulk", response_model=BulkMessageIdResponse)
+def get_or_create_message_ids(request: BulkMessageIdRequest):
+    """
+    Maps up to GENERATE_ID_BULK_MAX submission ids in one call; results keep input order.
+    New ids for one call are a contiguous counter range.
+    """
+    with GENERATE_ID_SECONDS.labels("bulk").time():
+        clean_ids = [submission_id.strip() for submission_id in request.submission_ids]
+
+        if not clean_ids:
+            raise HTTPException(status_code=400, detail="submission_ids cannot be empty")
+        if not all(clean_ids):
+            raise HTTPException(status_code=400, detail="Submission ID cannot be empty")
+        if len(clean_ids) > GENERATE_ID_BULK_MAX:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {GENERATE_ID_BULK_MAX} submission ids per call"
+            )
+
+        try:
+            type_code = validate_type_code(request.type_code)
+        except UnknownTypeCode as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        try:
+            rows = id_allocator.allocate_many(clean_ids, type_code)
+        except SequenceExhausted as e:
+            logger.error(str(e))
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+        except sqlite3.Error as e:
+            logger.error(f"Bulk message ID allocation failed: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+        results = [BulkMessageIdItem(submission_id=sid, message_id=mid, is_new=is_new) for sid, mid, is_new in rows]
+        created = sum(1 for item in results if item.is_new)
+        return BulkMessageIdResponse(results=results, created=created, existing=len(results) - created)
+
+@app.post("/db/id-sequences")
+def get_id_sequences():
+    """
+    Message-id capacity per type code and month.
+    """
+    try:
+        return {
+            "table": "id_sequences",
+            "data": id_allocator.usage(),
+            "timestamp": datetime.now().isoformat()
+        }
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+# --- Idempotent Report Requests ---
+report_guard = ReportGuard(db, ttl_seconds=int(os.getenv("REPORT_CACHE_TTL_SECONDS", "86400")))
+
+# --- Asynchronous Report Jobs ---
+job_store = JobStore(db)
+background_jobs = set()
+
+REPORT_RUNNERS = {
+    "company": (CompanyRequest, run_company_report),
+    "individual": (IndividualRequest, run_individual_report),
+}
+
+class CompanyJobRequest(CompanyRequest):
+    webhook_url: Optional[str] = None
+
+class IndividualJobRequest(IndividualRequest):
+    webhook_url: Optional[str] = None
+
+class JobSubmittedResponse(BaseModel):
+    job_id: str
+    status: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    job_type: str
+    status: str
+    pdf_link: Optional[str] = None
+    html_link: Optional[str] = None
+    attempt: Optional[int] = None
+    error: Optional[str] = None
+    queue_wait_seconds: Optional[float] = None
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+def job_status(job: dict) -> JobStatusResponse:
+    result = job["result"] or {}
+    return JobStatusResponse(
+        job_id=job["job_id"],
+        job_type=job["job_type"],
+        status=job["status"],
+        pdf_link=result.get("pdf_link"),
+        html_link=result.get("html_link"),
+        attempt=result.get("attempt"),
+        error=job["error"],
+        queue_wait_seconds=job["queue_wait_seconds"],
+        created_at=job["created_at"],
+        started_at=job["started_at"],
+        finished_at=job["finished_at"]
+    )
+
+async def run_job(job_id: str, job_type: str, payload: dict, webhook_url: Optional[str]):
+    request_model, runner = REPORT_RUNNERS[job_type]
+
+    # Jobs queued before profiles existed have none
+    profile = payload.get("profile") or DEFAULT_PROFILE
+    runtime = profiles[profile]
+    # Set when the submitter sent X-RPA-Debug; otherwise the admin toggle decides at run time
+    debug = payload.get("debug")
+    fields = {k: v for k, v in payload.items() if k not in ("profile", "debug")}
+
+    async def _scheduled():
+        async with runtime.scheduler.slot(job_type) as queue_wait:
+            await asyncio.to_thread(job_store.mark_running, job_id, queue_wait)
+            with tracer.start_as_current_span(f"rpa.job {job_type}", attributes={
+                "rpa.job_id": job_id,
+                "rpa.message_id": payload["message_id"],
+                "rpa.profile": profile,
+                "rpa.queue_wait_seconds": queue_wait,
+            }):
+                return await runner(request_model(**dict(fields, profile=profile)),
+                                    wants_debug(None) if debug is None else debug)
+
+    try:
+        result, source = await report_guard.run(guard_key(profile, payload["message_id"]), job_type, fields, _scheduled)
+        await asyncio.to_thread(job_store.mark_succeeded, job_id, result)
+        logger.info(f"Job {job_id} ({job_type}) succeeded ({source} result)")
+    except Exception as e:
+        error = e.detail if isinstance(e, HTTPException) else str(e)
+        await asyncio.to_thread(job_store.mark_failed, job_id, error)
+        logger.error(f"Job {job_id} ({job_type}) failed: {error}")
+
+    if webhook_url:
+        try:
+            body = job_status(await asyncio.to_thread(job_store.get, job_id)).dict()
+            await asyncio.to_thread(post_webhook, webhook_url, body)
+        except Exception as e:
+            logger.error(f"Webhook for job {job_id} to {webhook_url} failed: {str(e)}")
+
+def start_job(job_id: str, job_type: str, payload: dict, webhook_url: Optional[str]):
+    task = asyncio.create_task(run_job(job_id, job_type, payload, webhook_url))
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+
+async def submit_job(job_type: str, req: BaseModel, x_rpa_profile: Optional[str],
+                     x_rpa_debug: Optional[str] = None) -> JobSubmittedResponse:
+    runtime = resolve_profile(req, x_rpa_profile)
+    if runtime.scheduler.is_full():
+        raise queue_full(runtime)
+    payload = req.dict(exclude={"webhook_url"})
+    # Stored with the job so a queued or resumed job keeps the submitter's choice
+    payload["debug"] = wants_debug(x_rpa_debug) if x_rpa_debug is not None else None
+    # Off the event loop: a write can wait out busy_timeout behind another writer
+    job_id = await asyncio.to_thread(job_store.create, job_type, payload, req.webhook_url)
+    start_job(job_id, job_type, payload, req.webhook_url)
+    return JobSubmittedResponse(job_id=job_id, status=QUEUED)
+
+@app.on_event("startup")
+async def resume_jobs():
+    """Re-queues jobs that were waiting when the previous process stopped."""
+    for job in await asyncio.to_thread(job_store.unfinished, RUNNING):
+        # The bureau inquiry may already have been submitted, so never re-run it blindly
+        await asyncio.to_thread(job_store.mark_failed, job["job_id"], "Interrupted by a server restart")
+    for job in await asyncio.to_thread(job_store.unfinished, QUEUED):
+        if (job["payload"].get("profile") or DEFAULT_PROFILE) not in profiles:
+            await asyncio.to_thread(job_store.mark_failed, job["job_id"],
+                                    f"Profile {job['payload']['profile']} is no longer enabled")
+            continue
+        logger.info(f"Resuming queued job {job['job_id']} ({job['job_type']})")
+        start_job(job["job_id"], job["job_type"], job["payload"], job["webhook_url"])
+
+@app.post("/jobs/company", response_model=JobSubmittedResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_company_job(req: CompanyJobRequest, x_rpa_debug: Optional[str] = Header(None),
+                             x_rpa_profile: Optional[str] = Header(None)):
+    return await submit_job("company", req, x_rpa_profile, x_rpa_debug)
+
+@app.post("/jobs/individual", response_model=JobSubmittedResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_individual_job(req: IndividualJobRequest, x_rpa_debug: Optional[str] = Header(None),
+                                x_rpa_profile: Optional[str] = Header(None)):
+    return await submit_job("individual", req, x_rpa_profile, x_rpa_debug)
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job_status(job)
+
+
+# --- Batch Report Endpoints ---
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "2"))
+
+class BatchWorker:
+    """
+    One batch worker's long-lived, logged-in browser context, lent to each
+    report it runs in turn. Only the pages a report opened are closed after
+    it; the context is replaced if its browser went away.
+    """
+
+    def __init__(self):
+        self.context = None
+        self._stack = None
+
+    @asynccontextmanager
+    async def open_context(self, run: ReportRun):
+        if self.context is None or not self.context.browser.is_connected():
+            await self.close()
+            self._stack = AsyncExitStack()
+            self.context = await self._stack.enter_async_context(open_report_context(run))
+        before = set(self.context.pages)
+        try:
+            yield self.context
+        finally:
+            for page in self.context.pages:
+                if page not in before:
+                    await page.close()
+
+    async def close(self):
+        self.context = None
+        if self._stack is not None:
+            stack, self._stack = self._stack, None
+            await stack.aclose()
+
+def batch_line(fmt: str, event: str, body: dict) -> str:
+    if fmt == "sse":
+        return f"event: {event}\ndata: {json.dumps(body)}\n\n"
+    return json.dumps(body) + "\n"
+
+async def run_batch(runtime: ProfileRuntime, kind: str, items: list, debug: bool, fmt: str):
+    """Runs `items` on up to BATCH_WORKERS workers and yields each result as it completes, then a summary."""
+    started = time.monotonic()
+    pending = asyncio.Queue()
+    for index, req in enumerate(items):
+        pending.put_nowait((index, req))
+    results = asyncio.Queue()
+
+    async def _worker():
+        worker = BatchWorker()
+        try:
+            # Admitted once per worker, so a batch never holds a browser while queueing
+            async with runtime.scheduler.slot(kind):
+                while not pending.empty():
+                    index, req = pending.get_nowait()
+                    line = {"index": index, "message_id": req.message_id}
+                    try:
+                        with tracer.start_as_current_span(f"rpa.batch_item {kind}", attributes={
+                            "rpa.batch_index": index,
+                            "rpa.message_id": req.message_id,
+                            "rpa.profile": runtime.name,
+                        }):
+                            result, source = await report_guard.run(
+                                guard_key(req.profile, req.message_id), kind, req.dict(exclude={"profile"}),
+                                lambda: run_report(kind, req, debug, worker.open_context)
+                            )
+                        line.update(status="succeeded", source=source, attempt=result["attempt"],
+                                    pdf_link=result["pdf_link"], html_link=result["html_link"])
+                    except Exception as e:
+                        line.update(status="failed", error=getattr(e, "detail", None) or str(e))
+                    results.put_nowait(line)
+        except SchedulerFull as e:
+            logger.warning(f"Batch {kind} worker not admitted: {str(e)}")
+        finally:
+            await worker.close()
+            results.put_nowait(None)
+
+    workers = [asyncio.create_task(_worker()) for _ in range(min(BATCH_WORKERS, len(items)))]
+    running = len(workers)
+    succeeded = failed = 0
+    try:
+        while running:
+            line = await results.get()
+            if line is None:
+                running -= 1
+                continue
+            if line["status"] == "succeeded":
+                succeeded += 1
+            else:
+                failed += 1
+            yield batch_line(fmt, "result", line)
+
+        # Items no worker could take because none was admitted
+        while not pending.empty():
+            index, req = pending.get_nowait()
+            failed += 1
+            yield batch_line(fmt, "result", {"index": index, "message_id": req.message_id,
+                                             "status": "failed", "error": "RPA queue is full"})
+
+        yield batch_line(fmt, "summary", {"summary": {
+            "report_type": kind,
+            "profile": runtime.name,
+            "total": len(items),
+            "succeeded": succeeded,
+            "failed": failed,
+            "elapsed_seconds": round(time.monotonic() - started, 3)
+        }})
+    finally:
+        # The client may have gone away mid-stream
+        for task in workers:
+            task.cancel()
+
+def batch_response(kind: str, items: list, x_rpa_debug: Optional[str], x_rpa_profile: Optional[str],
+                   fmt: str) -> StreamingResponse:
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {BATCH_MAX_ITEMS} items")
+    if fmt not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+    # One batch runs on one profile's workers; items may repeat it in their profile field
+    runtimes = {resolve_profile(req, x_rpa_profile).name for req in items}
+    if len(runtimes) > 1:
+        raise HTTPException(status_code=400, detail="All items in a batch must use the same profile")
+    runtime = profiles[runtimes.pop()]
+    if runtime.scheduler.is_full():
+        raise queue_full(runtime)
+    media_type = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    return StreamingResponse(run_batch(runtime, kind, items, wants_debug(x_rpa_debug), fmt), media_type=media_type)
+
+@app.post("/batch/company")
+async def batch_company(items: List[CompanyRequest], format: str = "ndjson", x_rpa_debug: Optional[str] = Header(None),
+                        x_rpa_profile: Optional[str] = Header(None)):
+    return batch_response("company", items, x_rpa_debug, x_rpa_profile, format)
+
+@app.post("/batch/individual")
+async def batch_individual(items: List[IndividualRequest], format: str = "ndjson", x_rpa_debug: Optional[str] = Header(None),
+                           x_rpa_profile: Optional[str] = Header(None)):
+    return batch_response("individual", items, x_rpa_debug, x_rpa_profile, format)
 
 
 # ---  API-Key Security ---
@@ -460,17 +900,33 @@ templates = Jinja2Templates(directory="templates")
     "/config",
     response_model=ConfigModel,
 )
-def get_config():
-    # Initialize DB on startup
-    init_db()
-    return load_settings()
+def get_config(response: Response):
+    settings = config_service.snapshot()
+    response.headers["ETag"] = f'"{settings.version}"'
+    return settings.as_dict()
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Accepts `"3"`, `W/"3"` or `3`; `*` or no header means an unconditional write."""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid If-Match header: {if_match}")
 
 @app.put(
     "/config",
     response_model=ConfigModel,
 )
-def put_config(cfg: ConfigModel):
-    update_env(cfg.dict())
+def put_config(cfg: ConfigModel, response: Response, if_match: Optional[str] = Header(None)):
+    try:
+        settings = update_env(cfg.dict(), expected_version=parse_if_match(if_match))
+    except ConfigConflict as e:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(e))
+    response.headers["ETag"] = f'"{settings.version}"'
     return cfg
 
 from fastapi.responses import RedirectResponse
@@ -488,31 +944,27 @@ def get_counter_state_all():
     Get all fields and values from counter_state table.
     """
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            conn.row_factory = sqlite3.Row
-            with closing(conn.cursor()) as cursor:
-                cursor.execute("SELECT * FROM counter_state where id = 1")
-                rows = cursor.fetchall()
-                
-                if not rows:
-                    raise HTTPException(
-                        status_code=404, 
-                        detail="counter_state table is empty"
-                    )
-                
-                # Get column names
-                cursor.execute("PRAGMA table_info(counter_state)")
-                columns = [col[1] for col in cursor.fetchall()]
-                
-                result = {
-                    "table": "counter_state",
-                    "columns": columns,
-                    "data": [dict(row) for row in rows],
-                    "total_rows": len(rows),
-                    "timestamp": datetime.now().isoformat()
-                }
-                
-                return result
+        conn = db.connection()
+        rows = conn.execute("SELECT * FROM counter_state where id = 1").fetchall()
+        
+        if not rows:
+            raise HTTPException(
+                status_code=404, 
+                detail="counter_state table is empty"
+            )
+        
+        # Get column names
+        columns = [col[1] for col in conn.execute("PRAGMA table_info(counter_state)").fetchall()]
+        
+        result = {
+            "table": "counter_state",
+            "columns": columns,
+            "data": [dict(row) for row in rows],
+            "total_rows": len(rows),
+            "timestamp": datetime.now().isoformat()
+        }
+        
+        return result
                 
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -548,42 +1000,33 @@ class PaginatedIdMappingsResponse(BaseModel):
 def get_all_id_mappings():
     """
     Get ALL records from id_mappings table with all fields.
-    Warning: This might return large amounts of data.
+    Warning: This might return large amounts of data; prefer /db/id-mappings
+    (paginated) or /db/id-mappings/export (streamed).
     """
     try:
-        with closing(sqlite3.connect(DB_NAME)) as conn:
-            conn.row_factory = sqlite3.Row  # Enable dict-like access
-            with closing(conn.cursor()) as cursor:
-                
-                # Get all columns/fields from the table
-                cursor.execute("PRAGMA table_info(id_mappings)")
-                columns_info = cursor.fetchall()
-                columns = [col[1] for col in columns_info]
-                
-                # Get total count
-                cursor.execute("SELECT COUNT(*) FROM id_mappings")
-                total_records = cursor.fetchone()[0]
-                
-                # Get ALL data
-                cursor.execute("SELECT * FROM id_mappings ORDER BY created_at DESC")
-                rows = cursor.fetchall()
-                
-                # Convert rows to list of dictionaries
-                data = []
-                for row in rows:
-                    row_dict = {}
-                    for i, col_name in enumerate(columns):
-                        row_dict[col_name] = row[i]
-                    data.append(row_dict)
-                
-                return IdMappingsResponse(
-                    table_name="id_mappings",
-                    total_records=total_records,
-                    returned_records=len(data),
-                    columns=columns,
-                    data=data,
-                    timestamp=datetime.now().isoformat()
-                )
+        conn = db.connection()
+        
+        # Get all columns/fields from the table
+        columns_info = conn.execute("PRAGMA table_info(id_mappings)").fetchall()
+        columns = [col[1] for col in columns_info]
+        
+        # Get total count
+        total_records = conn.execute("SELECT COUNT(*) FROM id_mappings").fetchone()[0]
+        
+        # Get ALL data
+        rows = conn.execute("SELECT * FROM id_mappings ORDER BY created_at DESC").fetchall()
+        
+        # Convert rows to list of dictionaries
+        data = [dict(row) for row in rows]
+        
+        return IdMappingsResponse(
+            table_name="id_mappings",
+            total_records=total_records,
+            returned_records=len(data),
+            columns=columns,
+            data=data,
+            timestamp=datetime.now().isoformat()
+        )
                 
     except sqlite3.Error as e:
         raise HTTPException(
@@ -591,6 +1034,106 @@ def get_all_id_mappings():
             detail=f"Database error: {str(e)}"
         )
 
+# --- Paginated / streamed id_mappings ---
+ID_MAPPINGS_MAX_PAGE = 1000
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+
+def utc_timestamp(value: datetime) -> str:
+    """Formats `value` like CURRENT_TIMESTAMP; naive values are taken to be UTC already."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+def mapping_filters(submission_prefix: Optional[str], message_prefix: Optional[str],
+                    created_from: Optional[datetime], created_to: Optional[datetime]) -> dict:
+    # created_at holds SQLite CURRENT_TIMESTAMP text (UTC)
+    return {
+        "submission_prefix": submission_prefix,
+        "message_prefix": message_prefix,
+        "created_from": utc_timestamp(created_from) if created_from else None,
+        "created_to": utc_timestamp(created_to) if created_to else None,
+    }
+
+@app.post("/db/id-mappings", response_model=PaginatedIdMappingsResponse)
+def get_id_mappings_page(
+    limit: int = Query(100, ge=1, le=ID_MAPPINGS_MAX_PAGE),
+    cursor: Optional[str] = None,
+    submission_prefix: Optional[str] = None,
+    message_prefix: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+):
+    """
+    One page of id_mappings, newest first. Pass the returned next_cursor to get the next page.
+    created_from/created_to may carry an offset; values without one are read as UTC.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filters = mapping_filters(submission_prefix, message_prefix, created_from, created_to)
+    try:
+        # One extra row tells whether another page exists, without a COUNT(*)
+        rows = id_allocator.mappings(limit + 1, after, **filters)
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return PaginatedIdMappingsResponse(
+        table_name="id_mappings",
+        columns=MAPPING_COLUMNS,
+        data=[IdMappingRecord(**dict(row)) for row in rows],
+        pagination={
+            "limit": limit,
+            "returned_records": len(rows),
+            "has_more": has_more,
+            "next_cursor": encode_cursor(rows[-1]) if has_more else None,
+        },
+        timestamp=datetime.now().isoformat()
+    )
+
+def export_lines(fmt: str, filters: dict):
+    """Yields id_mappings rows page by page, so memory stays flat however large the table is."""
+    if fmt == "csv":
+        yield ",".join(MAPPING_COLUMNS) + "\r\n"
+    after = None
+    while True:
+        rows = id_allocator.mappings(EXPORT_PAGE_SIZE, after, **filters)
+        for row in rows:
+            if fmt == "csv":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerow([row[col] for col in MAPPING_COLUMNS])
+                yield buffer.getvalue()
+            else:
+                yield json.dumps(dict(row)) + "\n"
+        if len(rows) < EXPORT_PAGE_SIZE:
+            return
+        after = (rows[-1]["created_at"], rows[-1]["submission_id"])
+
+@app.post("/db/id-mappings/export")
+def export_id_mappings(
+    format: str = "ndjson",
+    submission_prefix: Optional[str] = None,
+    message_prefix: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+):
+    """
+    Streams every matching id_mappings row, newest first, as NDJSON or CSV.
+    created_from/created_to may carry an offset; values without one are read as UTC.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    filters = mapping_filters(submission_prefix, message_prefix, created_from, created_to)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_lines(format, filters),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=id_mappings.{format}"}
+    )
+
 @app.post("/launcher", response_class=HTMLResponse)
 def launcher_page(request: Request):
     return templates.TemplateResponse("launcher_admin_page.html", {"request": request})
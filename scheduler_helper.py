@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerFull(Exception):
+    """Raised when a job arrives and the wait queue is already at max depth."""
+
+
+class JobScheduler:
+    """
+    Admission control for RPA jobs.
+    At most `global_limit` jobs run at once and at most `type_limits[job_type]`
+    of each report type. Jobs that cannot start wait in a FIFO queue per type;
+    the oldest waiting job whose type has room is started first.
+    """
+
+    def __init__(self, global_limit: int, type_limits: dict, max_queue_depth: int):
+        self.global_limit = global_limit
+        self.type_limits = dict(type_limits)
+        self.max_queue_depth = max_queue_depth
+        self._running = 0
+        self._running_by_type = defaultdict(int)
+        self._queues = defaultdict(deque)
+
+    def _has_room(self, job_type: str) -> bool:
+        limit = self.type_limits.get(job_type, self.global_limit)
+        return self._running < self.global_limit and self._running_by_type[job_type] < limit
+
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def is_full(self) -> bool:
+        return self.queue_depth() >= self.max_queue_depth
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "running_by_type": dict(self._running_by_type),
+            "queued": self.queue_depth(),
+            "queued_by_type": {t: len(q) for t, q in self._queues.items()},
+        }
+
+    def _start(self, job_type: str):
+        self._running += 1
+        self._running_by_type[job_type] += 1
+
+    def _release(self, job_type: str):
+        self._running -= 1
+        self._running_by_type[job_type] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while True:
+            best_type = None
+            best_enqueued = None
+            for job_type, queue in self._queues.items():
+                # Drop waiters that gave up (client disconnected, task cancelled)
+                while queue and queue[0][1].done():
+                    queue.popleft()
+                if queue and self._has_room(job_type):
+                    if best_enqueued is None or queue[0][0] < best_enqueued:
+                        best_type = job_type
+                        best_enqueued = queue[0][0]
+            if best_type is None:
+                return
+            _, waiter = self._queues[best_type].popleft()
+            self._start(best_type)
+            waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, job_type: str):
+        """Waits for a run slot and yields the seconds spent queueing."""
+        enqueued_at = time.monotonic()
+        if not self._queues[job_type] and self._has_room(job_type):
+            self._start(job_type)
+        else:
+            if self.is_full():
+                raise SchedulerFull(f"RPA queue is full ({self.max_queue_depth} jobs waiting)")
+            waiter = asyncio.get_running_loop().create_future()
+            self._queues[job_type].append((enqueued_at, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was granted just as we were cancelled; hand it on
+                    self._release(job_type)
+                else:
+                    self._queues[job_type] = deque(
+                        item for item in self._queues[job_type] if item[1] is not waiter
+                    )
+                raise
+
+        wait_seconds = time.monotonic() - enqueued_at
+        if wait_seconds >= 1:
+            logger.info(f"{job_type} job started after {wait_seconds:.1f}s in queue")
+        try:
+            yield wait_seconds
+        finally:
+            self._release(job_type)
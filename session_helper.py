@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import logging
+from tracing_helper import tracer
+
+logger = logging.getLogger(__name__)
+
+LOGIN_PATH = "/account/login"
+
+
+def is_login_page(url: str) -> bool:
+    """True when CLIK has sent us (back) to the login form."""
+    return LOGIN_PATH in url.lower()
+
+
+async def login(page, login_url: str, username: str, password: str):
+    """Runs the CLIK login flow on `page`, switching the portal to English first."""
+    with tracer.start_as_current_span("clik.login", attributes={"clik.username": username}):
+        # Locators auto-wait for their element, so only the DOM has to be parsed
+        await page.goto(login_url, wait_until="domcontentloaded")
+        await page.get_by_role("button", name="").click()
+        await page.get_by_role("link", name="English").click()
+
+        await page.wait_for_load_state("domcontentloaded")
+        await page.get_by_role("textbox", name="Username").fill(username)
+        await page.get_by_role("textbox", name="Password").fill(password)
+        await page.get_by_role("button", name="Login").click()
+        await page.wait_for_load_state("domcontentloaded")
+
+
+class SessionCache:
+    """
+    Keeps one authenticated Playwright storage_state per credential set.
+    New contexts start from the cached state; an expired session is detected by
+    the redirect to /Account/Login and re-authenticated transparently.
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._locks = {}
+
+    @staticmethod
+    def key(login_url: str, username: str, password: str) -> tuple:
+        digest = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        return (login_url, username, digest)
+
+    def state_for(self, key: tuple):
+        """Returns the cached storage_state for `key`, or None if we never logged in."""
+        return self._states.get(key)
+
+    def invalidate(self, key: tuple):
+        self._states.pop(key, None)
+
+    async def ensure_logged_in(self, page, key: tuple, login_url: str, base_url: str,
+                               username: str, password: str):
+        """Opens `base_url` on `page`, logging in first if the session is missing or expired."""
+        with tracer.start_as_current_span("playwright.goto", attributes={"http.url": base_url}):
+            await page.goto(base_url, wait_until="domcontentloaded")
+        if not is_login_page(page.url):
+            return
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Another request may have re-authenticated while we waited for the lock
+            state = self._states.get(key)
+            if state:
+                await page.context.add_cookies(state["cookies"])
+                await page.goto(base_url, wait_until="domcontentloaded")
+                if not is_login_page(page.url):
+                    return
+
+            logger.info(f"CLIK session for {username} missing or expired, logging in")
+            self.invalidate(key)
+            await login(page, login_url, username, password)
+            if is_login_page(page.url):
+                raise RuntimeError(f"CLIK login failed for user {username}")
+            self._states[key] = await page.context.storage_state()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The helpers are top-level modules next to new-main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
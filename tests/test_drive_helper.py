@@ -0,0 +1,21 @@
+import threading
+from unittest import mock
+
+import drive_helper
+
+
+def test_service_builds_on_cold_client():
+    client = drive_helper.DriveClient()
+    creds = mock.Mock(expiry=None, valid=True)
+    result = {}
+
+    with mock.patch.object(client, "_authenticate", return_value=creds), \
+            mock.patch.object(drive_helper, "build", return_value="service") as build:
+        worker = threading.Thread(target=lambda: result.setdefault("service", client.service()), daemon=True)
+        worker.start()
+        worker.join(timeout=5)
+
+    assert not worker.is_alive(), "service() deadlocked on its own lock"
+    assert result["service"] == "service"
+    build.assert_called_once_with("drive", "v3", credentials=creds, cache_discovery=False)
+    assert client.service() == "service"
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from flow_helper import ReportRun, Step, StepFailed, execute
+
+
+class Req:
+    message_id = "00001FTICLI102026"
+
+
+def make_run():
+    return ReportRun("company", Req(), open_context=None, resume_page=None)
+
+
+def recording_step(name, calls, fail_times=0, submits=False, **policy):
+    async def run(report_run):
+        calls.append(name)
+        if submits:
+            report_run.submitted = True
+        if calls.count(name) <= fail_times:
+            raise RuntimeError(f"{name} failed")
+    return Step(name, run, needs_page=False, base_delay=0, **policy)
+
+
+def test_failure_before_submit_restarts_from_login():
+    calls = []
+    steps = [
+        recording_step("login", calls),
+        recording_step("form_fill", calls, fail_times=1, restart_from="login"),
+        recording_step("submit", calls, submits=True, restart_from="login"),
+    ]
+    asyncio.run(execute(make_run(), steps))
+    assert calls == ["login", "form_fill", "login", "form_fill", "submit"]
+
+
+def test_failed_submit_is_never_resent():
+    calls = []
+    steps = [
+        recording_step("login", calls),
+        recording_step("form_fill", calls, restart_from="login"),
+        recording_step("submit", calls, fail_times=3, submits=True, restart_from="login"),
+    ]
+    with pytest.raises(StepFailed) as failed:
+        asyncio.run(execute(make_run(), steps))
+    assert failed.value.step == "submit"
+    assert calls == ["login", "form_fill", "submit"]
+
+
+def test_failure_after_submit_never_reruns_earlier_steps():
+    calls = []
+    steps = [
+        recording_step("login", calls),
+        recording_step("submit", calls, submits=True, restart_from="login"),
+        recording_step("capture_html", calls, fail_times=1),
+        recording_step("download_pdf", calls, fail_times=3, restart_from="login"),
+    ]
+    with pytest.raises(StepFailed) as failed:
+        asyncio.run(execute(make_run(), steps))
+    assert failed.value.step == "download_pdf"
+    # capture_html retried in place; nothing before the submission ran again
+    assert calls == ["login", "submit", "capture_html", "capture_html", "download_pdf"]
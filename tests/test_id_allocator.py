@@ -0,0 +1,162 @@
+import multiprocessing
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime
+from unittest import mock
+
+import pytest
+
+import id_helper
+from db_helper import Database
+from id_helper import MessageIdAllocator, SequenceExhausted
+
+THREADS = 16
+SUBMISSIONS = 300
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "ids.db"))
+    database.migrate()
+    yield database
+    database.close_all()
+
+
+def _run_threads(target, count=THREADS):
+    errors = []
+
+    def guarded(index):
+        try:
+            target(index)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=guarded, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+
+
+def _assert_unique(db, expected_submissions):
+    rows = db.connection().execute("SELECT submission_id, message_id FROM id_mappings").fetchall()
+    assert {row["submission_id"] for row in rows} == expected_submissions
+    repeated = [mid for mid, n in Counter(row["message_id"] for row in rows).items() if n > 1]
+    assert not repeated, repeated
+
+
+def test_allocate_concurrent_threads(db):
+    allocator = MessageIdAllocator(db)
+    seen = [dict() for _ in range(THREADS)]
+
+    def work(index):
+        # Every thread walks the same submissions from a different start, so they overlap
+        for n in range(SUBMISSIONS):
+            sid = f"sub-{(n + index * 7) % SUBMISSIONS}"
+            message_id, _ = allocator.allocate(sid)
+            seen[index][sid] = message_id
+
+    _run_threads(work)
+
+    # Every caller got the same id for a submission
+    for sid in (f"sub-{n}" for n in range(SUBMISSIONS)):
+        assert len({s[sid] for s in seen}) == 1
+    _assert_unique(db, {f"sub-{n}" for n in range(SUBMISSIONS)})
+    assert sum(row["used"] for row in allocator.usage()) == SUBMISSIONS
+
+
+def test_allocate_many_concurrent_with_allocate(db):
+    allocator = MessageIdAllocator(db)
+    new_counts = Counter()
+    lock = threading.Lock()
+
+    def work(index):
+        for batch in range(10):
+            start = (batch * 25 + index * 13) % SUBMISSIONS
+            sids = [f"sub-{(start + k) % SUBMISSIONS}" for k in range(40)]
+            if index % 2:
+                results = allocator.allocate_many(sids + sids[:5])
+            else:
+                results = [(sid, *allocator.allocate(sid)) for sid in sids]
+            with lock:
+                new_counts.update(sid for sid, _, is_new in results if is_new)
+
+    _run_threads(work)
+
+    # Each submission is reported as new exactly once across all callers
+    assert set(new_counts.values()) == {1}
+    _assert_unique(db, set(new_counts))
+
+
+def _allocate_in_process(path, index, queue):
+    database = Database(path)
+    allocator = MessageIdAllocator(database)
+    ids = {}
+    for n in range(100):
+        sid = f"sub-{(n + index * 11) % 150}"
+        ids[sid] = allocator.allocate(sid)[0]
+    database.close_all()
+    queue.put(ids)
+
+
+def test_allocate_concurrent_processes(db):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    workers = [ctx.Process(target=_allocate_in_process, args=(db.path, i, queue)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    results = [queue.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+
+    merged = {}
+    for ids in results:
+        for sid, message_id in ids.items():
+            assert merged.setdefault(sid, message_id) == message_id
+    _assert_unique(db, set(merged))
+
+
+def _at(year, month):
+    return mock.patch.object(id_helper, "datetime", mock.Mock(now=mock.Mock(return_value=datetime(year, month, 15))))
+
+
+def test_month_rollover_restarts_counter(db):
+    allocator = MessageIdAllocator(db)
+    with _at(2026, 9):
+        assert allocator.allocate("a")[0] == "00001FTICLI092026"
+        assert [r[1] for r in allocator.allocate_many(["b", "c"])] == ["00002FTICLI092026", "00003FTICLI092026"]
+    with _at(2026, 10):
+        assert allocator.allocate("d")[0] == "00001FTICLI102026"
+        assert allocator.allocate_many(["a", "e"]) == [
+            ("a", "00001FTICLI092026", False),
+            ("e", "00002FTICLI102026", True),
+        ]
+    _assert_unique(db, {"a", "b", "c", "d", "e"})
+
+
+def test_exhausted_month_does_not_wrap(db):
+    allocator = MessageIdAllocator(db, capacity=3)
+    with _at(2026, 10):
+        allocator.allocate_many(["a", "b"])
+        with pytest.raises(SequenceExhausted):
+            allocator.allocate_many(["c", "d"])
+        assert allocator.allocate("c")[0] == "00003FTICLI102026"
+        with pytest.raises(SequenceExhausted):
+            allocator.allocate("d")
+    with _at(2026, 11):
+        assert allocator.allocate("d")[0] == "00001FTICLI112026"
+    _assert_unique(db, {"a", "b", "c", "d"})
+
+
+def test_allocate_many_within_old_variable_limit(db):
+    # SQLite builds before 3.32 cap bound variables at 999
+    db.connection().setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    allocator = MessageIdAllocator(db)
+    sids = [f"sub-{n}" for n in range(1000)]
+    allocator.allocate_many(sids[:400])
+    results = allocator.allocate_many(sids)
+    assert [is_new for _, _, is_new in results] == [False] * 400 + [True] * 600
+    _assert_unique(db, set(sids))
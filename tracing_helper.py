@@ -0,0 +1,66 @@
+import json
+import logging
+import os
+import threading
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor, ConsoleSpanExporter, SpanExporter, SpanExportResult
+)
+
+logger = logging.getLogger(__name__)
+
+# --- TRACING CONFIGURATION ---
+# none | otlp | console | file
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "rpa-clik")
+# Used by the file exporter; one JSON span per line
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+# The OTLP exporter reads OTEL_EXPORTER_OTLP_ENDPOINT / _HEADERS itself
+
+tracer = trace.get_tracer("rpa-clik")
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends finished spans to a JSON-lines file, for offline testing without a collector."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans) -> SpanExportResult:
+        lines = "".join(json.dumps(json.loads(span.to_json())) + "\n" for span in spans)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def _exporter(name: str):
+    if name == "otlp":
+        # Imported here so the OTLP stack is only loaded when it is used
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if name == "console":
+        return ConsoleSpanExporter()
+    if name == "file":
+        return FileSpanExporter(TRACING_FILE)
+    raise ValueError(f"Unknown TRACING_EXPORTER '{name}', expected none, otlp, console or file")
+
+
+def setup_tracing(exporter: str = TRACING_EXPORTER):
+    """
+    Installs the global tracer provider with the chosen exporter and returns it.
+    With 'none' nothing is installed and every span is a no-op.
+    """
+    if exporter == "none":
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": TRACING_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(_exporter(exporter)))
+    trace.set_tracer_provider(provider)
+    logger.info(f"Tracing enabled, exporting spans via {exporter}")
+    return provider